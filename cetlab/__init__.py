@@ -0,0 +1,18 @@
+"""
+Conversion of weather data to wind and solar generation profiles of sites.
+"""
+
+from .convert import open_cutout, pv_generation, wind_generation, layout_generation
+from .cache import CutoutCache
+from .weather import WeatherArchive
+from .streaming import stream_generation, write_chunks
+from .sites import map_sites
+from .layout import SparseLayout
+from .masks import MaskStore
+from .screening import screen_cells, screen_region
+from .optimize import optimal_orientation
+from .sweep import pv_sweep, wind_sweep
+from .store import ProfileStore
+from .incremental import update_profiles
+from .stats import ProfileStatistics, capacity_factor
+from .plotting import plot_profiles
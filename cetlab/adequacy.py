@@ -0,0 +1,124 @@
+"""
+Firm-capacity and storage requirements of many portfolios.
+
+For every combination of a portfolio (capacity-weighted sites) and a load
+scenario the residual load is formed and summarized by its peak, its
+duration curve and the smallest storage that covers all deficits above a
+firm capacity. Storage is sized with the sequent-peak rule written in closed
+form (running cumulative sums and minima), so all combinations are
+evaluated as array operations; portfolios are split into batches that run
+in a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .analysis import _as_load, portfolio_generation
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def storage_requirement(residual, firm=0., efficiency=0.85):
+    """
+    Minimum storage energy and power to cover ``residual`` above ``firm``.
+
+    ``residual`` is an array (..., time) of residual load in MW on an hourly
+    grid. Deficits above ``firm`` are discharged from storage, surpluses
+    (negative residual load) recharge it with round-trip ``efficiency``.
+    The series is treated as repeating, so storage drawn down at the end
+    must be refilled at the start; where the surplus over a cycle cannot
+    make up for the deficits no storage suffices and the energy is inf.
+    Returns the energy (MWh) and power (MW) arrays of shape (...).
+    """
+    deficit = np.clip(residual - firm, 0., None)
+    surplus = np.clip(-residual, 0., None)
+    net = deficit - efficiency * surplus
+    feasible = net.sum(axis=-1) <= 0.
+
+    # Sequent peak over two cycles: K_t = max(0, K_t-1 + net_t) equals the
+    # cumulative sum minus its running minimum (starting from 0)
+    net = np.concatenate([net, net], axis=-1)
+    cumulative = np.cumsum(net, axis=-1)
+    running_min = np.minimum(np.minimum.accumulate(cumulative, axis=-1), 0.)
+    energy = np.where(feasible, (cumulative - running_min).max(axis=-1), np.inf)
+    return energy, deficit.max(axis=-1)
+
+
+def duration_curve(residual, points=101):
+    """
+    Residual load duration curve at ``points`` equally spaced exceedance
+    fractions from 0 (peak) to 1 (minimum), shape (..., points).
+    """
+    return np.quantile(residual, np.linspace(1., 0., points), axis=-1)\
+             .transpose(tuple(range(1, residual.ndim)) + (0,))
+
+
+def _evaluate(generation, load, firm, efficiency, points):
+    "All metrics for a (portfolio, time) batch against (scenario, time) load."
+    residual = load[np.newaxis, :, :] - generation[:, np.newaxis, :]
+    energy, power = storage_requirement(residual, firm, efficiency)
+    return dict(peak=residual.max(axis=-1),
+                energy=energy, power=power,
+                duration=duration_curve(residual, points))
+
+
+def requirements(profiles, portfolios, load, firm=0., efficiency=0.85,
+                 points=101, max_elements=5e7, processes=None):
+    """
+    Peak residual demand, duration curve and storage needs of every
+    (portfolio, scenario) combination.
+
+    ``profiles`` are (site, time) per-unit profiles weighted by the
+    (portfolio, site) ``portfolios`` (capacities in MW), see
+    ``portfolio_generation``. ``load`` is a Series/DataArray over time or a
+    (scenario, time) DataArray or a DataFrame with one column per scenario.
+    Portfolios are evaluated in batches of at most ``max_elements``
+    residual values, spread over ``processes`` workers (all cores when
+    there is more than one batch). Returns a Dataset over (portfolio,
+    scenario[, exceedance]).
+    """
+    if isinstance(load, pd.DataFrame):
+        load = xr.DataArray(load.values.T, coords={'scenario': load.columns,
+                                                   'time': load.index},
+                            dims=('scenario', 'time'))
+    load = _as_load(load)
+    if 'scenario' not in load.dims:
+        load = load.expand_dims(scenario=[load.name or 'load'])
+
+    generation = portfolio_generation(profiles, portfolios)
+    generation, load = xr.align(generation, load, join='inner', exclude=('portfolio', 'scenario'))
+    gen = generation.transpose('portfolio', 'time').values
+    ld = load.transpose('scenario', 'time').values
+
+    nport, nscen, ntime = gen.shape[0], ld.shape[0], gen.shape[1]
+    batch = max(1, int(max_elements // (2 * nscen * ntime)))
+    batches = [slice(i, i + batch) for i in range(0, nport, batch)]
+    if processes is None:
+        processes = os.cpu_count() if len(batches) > 1 else 1
+    logger.info("Evaluating %d portfolios x %d scenarios in %d batches",
+                nport, nscen, len(batches))
+
+    args = [(gen[b], ld, firm, efficiency, points) for b in batches]
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_evaluate, *zip(*args)))
+    else:
+        results = [_evaluate(*a) for a in args]
+
+    def stack(key):
+        return np.concatenate([r[key] for r in results], axis=0)
+
+    dims = ('portfolio', 'scenario')
+    return xr.Dataset({'peak residual load': (dims, stack('peak')),
+                       'storage energy': (dims, stack('energy')),
+                       'storage power': (dims, stack('power')),
+                       'duration curve': (dims + ('exceedance',), stack('duration'))},
+                      coords={'portfolio': generation['portfolio'],
+                              'scenario': load['scenario'],
+                              'exceedance': np.linspace(0., 1., points)},
+                      attrs={'firm': firm, 'efficiency': efficiency})
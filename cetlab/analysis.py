@@ -0,0 +1,145 @@
+"""
+Correlation of generation with load and residual load.
+
+All functions take (site, time) profiles, or (portfolio, time) profiles from
+``portfolio_generation``, together with a load time series and work on the
+whole array at once; no Python loop runs over sites or portfolios.
+Profiles and load are aligned on their common time steps first.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def _as_load(load):
+    if isinstance(load, pd.Series):
+        load = xr.DataArray(load.values, coords={'time': load.index}, dims='time',
+                            name=load.name or 'load')
+    return load
+
+
+def _align(profiles, load):
+    "Profiles as (n, time) and load as (time,) arrays on their common time steps."
+    profiles, load = xr.align(profiles, _as_load(load), join='inner', exclude=())
+    dim = [d for d in profiles.dims if d != 'time'][0]
+    return profiles.transpose(dim, 'time'), load, dim
+
+
+def _pearson(x, y):
+    "Pearson correlation of every row of ``x`` (n, time) with ``y`` (time,)."
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x * y).sum(axis=-1) / np.sqrt((x ** 2).sum(axis=-1) * (y ** 2).sum(axis=-1))
+
+
+def _ranks(values):
+    "Ranks along the last axis, averaging ties."
+    from scipy.stats import rankdata
+    return rankdata(values, axis=-1)
+
+
+def portfolio_generation(profiles, portfolios):
+    """
+    Generation of many portfolios as one matrix product.
+
+    ``portfolios`` is a (portfolio, site) DataFrame or DataArray of weights
+    applied to the (site, time) ``profiles``, e.g. installed capacities in
+    MW for per-unit profiles. Returns a (portfolio, time) DataArray.
+    """
+    if isinstance(portfolios, pd.DataFrame):
+        portfolios = xr.DataArray(portfolios.values,
+                                  coords={'portfolio': portfolios.index.values,
+                                          'site': portfolios.columns.values},
+                                  dims=('portfolio', 'site'))
+    portfolios = portfolios.reindex(site=profiles.indexes['site'], fill_value=0.)
+    values = portfolios.transpose('portfolio', 'site').values @ \
+        profiles.transpose('site', 'time').values
+    return xr.DataArray(values, coords={'portfolio': portfolios['portfolio'],
+                                        'time': profiles['time']},
+                        dims=('portfolio', 'time'), name='generation')
+
+
+def correlation(profiles, load, method='pearson'):
+    """
+    Correlation of every profile with ``load``.
+
+    ``method`` is 'pearson' or 'spearman' (rank correlation).
+    """
+    profiles, load, dim = _align(profiles, load)
+    x, y = profiles.values, load.values
+    if method == 'spearman':
+        x, y = _ranks(x), _ranks(y)
+    elif method != 'pearson':
+        raise ValueError("Unknown correlation method '{}'".format(method))
+    return xr.DataArray(_pearson(x, y), coords={dim: profiles[dim]}, dims=dim,
+                        name='correlation')
+
+
+def rolling_correlation(profiles, load, window):
+    """
+    Pearson correlation with ``load`` over a trailing window of ``window``
+    time steps, labelled by the window's last time step.
+
+    Window sums are taken from cumulative sums, so the cost does not grow
+    with the window length.
+    """
+    profiles, load, dim = _align(profiles, load)
+    # Centering first keeps the cumulative sums well conditioned
+    x = profiles.values - profiles.values.mean(axis=1, keepdims=True)
+    y = load.values - load.values.mean()
+
+    def window_sum(a):
+        c = np.cumsum(a, axis=-1)
+        c = np.concatenate([np.zeros(c.shape[:-1] + (1,)), c], axis=-1)
+        return c[..., window:] - c[..., :-window]
+
+    n = float(window)
+    sx, sy = window_sum(x), window_sum(y)
+    sxx, syy, sxy = window_sum(x ** 2), window_sum(y ** 2), window_sum(x * y)
+    cov = sxy - sx * sy / n
+    var_x = np.clip(sxx - sx ** 2 / n, 0., None)
+    var_y = np.clip(syy - sy ** 2 / n, 0., None)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = cov / np.sqrt(var_x * var_y)
+
+    return xr.DataArray(values, coords={dim: profiles[dim],
+                                        'time': profiles['time'][window - 1:]},
+                        dims=(dim, 'time'), name='rolling correlation')
+
+
+def lagged_correlation(profiles, load, max_lag):
+    """
+    Pearson correlation of every profile shifted by -``max_lag`` to
+    ``max_lag`` time steps with ``load``.
+
+    A positive lag correlates generation at ``t + lag`` with load at ``t``.
+    Each lag uses the overlapping time steps only. Returns a (profile, lag)
+    DataArray.
+    """
+    profiles, load, dim = _align(profiles, load)
+    x, y = profiles.values, load.values
+    ntime = len(y)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    values = np.empty((x.shape[0], len(lags)))
+    for i, lag in enumerate(lags):
+        if lag >= 0:
+            values[:, i] = _pearson(x[:, lag:], y[:ntime - lag])
+        else:
+            values[:, i] = _pearson(x[:, :lag], y[-lag:])
+
+    return xr.DataArray(values, coords={dim: profiles[dim], 'lag': lags},
+                        dims=(dim, 'lag'), name='lagged correlation')
+
+
+def residual_load(profiles, load):
+    """
+    Load minus generation for every profile, a (profile, time) DataArray.
+
+    ``profiles`` must be in the same units as ``load``, e.g. MW from
+    ``portfolio_generation``.
+    """
+    profiles, load, dim = _align(profiles, load)
+    return (load - profiles).transpose(dim, 'time').rename('residual load')
@@ -0,0 +1,289 @@
+"""
+Batch runner for many regions, years, site tables and technologies.
+
+A job spec (JSON, or YAML if PyYAML is installed) lists the regions and the
+jobs to run::
+
+    {
+      "cache_dir": "cutout_cache",
+      "max_size": 50e9,
+      "output": "profiles",
+      "regions": {
+        "south_africa": {"module": "era5",
+                         "xs": [12.319845, 36.469981], "ys": [-21.564172, -35.85149]}
+      },
+      "jobs": [
+        {"region": "south_africa", "years": [2011, 2012], "months": [1, 12],
+         "sites": "pv_sites.csv", "technology": "pv", "panel": "CdTe"},
+        {"region": "south_africa", "start": "2011-01",
+         "sites": "wind_sites.csv", "technology": "wind"}
+      ]
+    }
+
+A job covers the atlite style ``years`` x ``months`` or the consecutive
+months from ``start`` to ``end`` ("YYYY-MM"). Without an ``end`` the job
+runs up to the latest complete month that can be prepared, so rerunning
+the same spec every month picks up the new data. Jobs are named after their
+region, technology and site table unless they set a ``name``; the name
+(not the period) keys the stored profiles, so extending the period only
+converts the new months.
+
+Site tables are CSV files with a ``name`` column (or inline lists of
+records). Every distinct cutout is prepared once through the cutout cache
+before the jobs are spread over a process pool; jobs whose months cannot
+be prepared are reported as failed. Each job streams its
+profiles month by month into its own group of the profile store
+``<output>/profiles.zarr``, converting only the months that earlier runs
+have not stored yet (or into ``<output>/<job name>/YYYYMM.nc`` files
+with ``"format": "netcdf"``), and a summary of all jobs is written to
+``<output>/jobs.json``.
+
+On machines without network access, ``"archive": "<path>"`` reads every
+cutout directly from a local weather archive (see ``cetlab.weather``)
+instead of preparing months into the cache.
+
+Run it with ``python -m cetlab.batch spec.json``.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .cache import CutoutCache, open_entries, _months
+from .incremental import update_profiles
+from .store import ProfileStore
+from .streaming import stream_generation, write_chunks
+from .weather import WeatherArchive
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Job keys passed on to the conversion functions
+CONVERSION_KEYS = ['panel', 'orientation', 'turbine', 'capacity_factor']
+
+
+def load_spec(path):
+    "Read a job spec and resolve its relative paths against the spec's directory."
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    for key in ('cache_dir', 'output', 'archive'):
+        if key in spec:
+            spec[key] = os.path.join(base, spec[key])
+    for job in spec.get('jobs', []):
+        if isinstance(job.get('sites'), str):
+            job['sites'] = os.path.join(base, job['sites'])
+    return spec
+
+
+def load_sites(sites):
+    "Site table from a CSV file name or a list of records, indexed by name."
+    if isinstance(sites, str):
+        return pd.read_csv(sites).set_index('name')
+    return pd.DataFrame.from_records(sites).set_index('name')
+
+
+def _as_range(value, default):
+    "(start, stop) pair from a scalar, a pair or None."
+    if value is None:
+        return default
+    if isinstance(value, (list, tuple)):
+        return int(value[0]), int(value[-1])
+    return int(value), int(value)
+
+
+def _month_range(start, end):
+    "(year, month) pairs from ``start`` to ``end`` ('YYYY-MM'), both included."
+    return [(p.year, p.month) for p in pd.period_range(start, end, freq='M')]
+
+
+def _sites_label(sites):
+    "Short label of a site table: the CSV file name or a digest of the records."
+    if isinstance(sites, str):
+        return os.path.splitext(os.path.basename(sites))[0]
+    digest = hashlib.sha1(json.dumps(sites, sort_keys=True).encode()).hexdigest()
+    return 'sites-' + digest[:8]
+
+
+def expand_jobs(spec):
+    """
+    Fill in the defaults of every job in ``spec``.
+
+    Each job gets a ``name``, its ``region`` resolved to the region dict,
+    the list of (year, month) pairs it covers as ``months`` and whether
+    that list runs up to the latest available month (``open_end``).
+    """
+    jobs = []
+    for i, job in enumerate(spec['jobs']):
+        job = dict(job)
+        region = spec['regions'][job['region']]
+        if 'start' in job:
+            job['open_end'] = job.get('end') is None
+            end = job.get('end') or pd.Timestamp.now().strftime('%Y-%m')
+            job['months'] = _month_range(job['start'], end)
+        else:
+            years = _as_range(job.get('years'), None)
+            months = _as_range(job.get('months'), (1, 12))
+            job['open_end'] = False
+            job['months'] = _months(slice(*years), slice(*months))
+        job.setdefault('name', '{}_{}_{}'.format(job['region'], job['technology'],
+                                                 _sites_label(job['sites'])))
+        job['cutout'] = (job['region'], tuple(job['months']), job['open_end'])
+        job['region'] = dict(region, name=job['region'])
+        job['region'].setdefault('module', 'era5')
+        jobs.append(job)
+
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Job names must be unique")
+    return jobs
+
+
+def prepare_cutout(cache, region, months, open_end=False):
+    """
+    Cache entries of ``months`` of ``region``, one per month.
+
+    With ``open_end`` the job stops before the first month that cannot be
+    prepared or is not complete yet, which the next run picks up again;
+    any other failure is raised.
+    """
+    files = []
+    for year, month in months:
+        try:
+            files += cache.prepare(region['module'], slice(*region['xs']), slice(*region['ys']),
+                                   slice(year, year), slice(month, month), evict=False)
+        except Exception as e:
+            if not (open_end and files):
+                raise
+            logger.info("Stopping %s at %04d-%02d, which is not available yet: %r",
+                        region['name'], year, month, e)
+            break
+    return files
+
+
+def run_job(job, files, output, format='zarr'):
+    """
+    Convert one job on the prepared cache entries ``files``, or on a
+    ``WeatherArchive``; runs in a worker.
+    """
+    start = time.time()
+    region = job['region']
+    if isinstance(files, WeatherArchive):
+        ds = files.select(slice(*region['xs']), slice(*region['ys']), job['months'])
+    else:
+        ds = open_entries(files, slice(*region['xs']), slice(*region['ys']))
+    sites = load_sites(job['sites'])
+    kwds = {k: job[k] for k in CONVERSION_KEYS if k in job}
+
+    freq = job.get('freq', 'M')
+    if format == 'netcdf':
+        chunks = stream_generation(ds, sites, job['technology'], freq=freq, **kwds)
+        written = write_chunks(chunks, os.path.join(output, job['name']))
+        added = None
+    else:
+        # Only time steps beyond what an earlier run stored are converted
+        store = ProfileStore(os.path.join(output, 'profiles.zarr'), group=job['name'])
+        manifests = os.path.join(output, 'manifests')
+        os.makedirs(manifests, exist_ok=True)
+        added = update_profiles(ds, sites, job['technology'], store,
+                                manifest=os.path.join(manifests, job['name'] + '.json'),
+                                freq=freq, **kwds)
+        written = [os.path.join(store.path, job['name'])]
+    return dict(name=job['name'], status='done', files=written, added=added,
+                sites=len(sites), seconds=time.time() - start)
+
+
+def run(spec, processes=None, fetch=None):
+    """
+    Run every job of ``spec`` (a dict or the path of a spec file).
+
+    Cutouts shared between jobs are prepared once in this process, then the
+    jobs run on ``processes`` workers (default: all cores). Returns the job
+    summaries; failed jobs are reported with their error instead of
+    stopping the batch.
+    """
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+    jobs = expand_jobs(spec)
+    output = spec.get('output', 'profiles')
+    os.makedirs(output, exist_ok=True)
+
+    if 'archive' in spec:
+        # Jobs read their cutouts straight from the archive, nothing to prepare
+        archive, cache = WeatherArchive(spec['archive']), None
+        files = {job['cutout']: archive for job in jobs}
+    else:
+        cache_kwds = {} if fetch is None else {'fetch': fetch}
+        cache = CutoutCache(spec.get('cache_dir', 'cutout_cache'),
+                            max_size=spec.get('max_size'), **cache_kwds)
+        files = {}
+
+    # Eviction waits until all jobs are done, so one cutout cannot push out
+    # the months of another before it has been read
+    errors = {}
+    for job in jobs:
+        if job['cutout'] not in files and job['cutout'] not in errors:
+            try:
+                files[job['cutout']] = prepare_cutout(cache, job['region'], job['months'],
+                                                      job['open_end'])
+            except Exception as e:
+                logger.exception("Preparing the cutout of %s failed", job['name'])
+                errors[job['cutout']] = repr(e)
+    logger.info("Prepared %d cutouts for %d jobs", len(files), len(jobs))
+
+    format = spec.get('format', 'zarr')
+    if format != 'netcdf':
+        # Create the shared store up front so workers only add their groups
+        import zarr
+        zarr.open_group(os.path.join(output, 'profiles.zarr'), mode='a')
+
+    summaries = [dict(name=job['name'], status='failed', error=errors[job['cutout']])
+                 for job in jobs if job['cutout'] in errors]
+    with ProcessPoolExecutor(processes or spec.get('processes')) as pool:
+        futures = {pool.submit(run_job, job, files[job['cutout']], output, format): job
+                   for job in jobs if job['cutout'] in files}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                summary = future.result()
+                logger.info("Finished %s in %.1fs", job['name'], summary['seconds'])
+            except Exception as e:
+                logger.exception("Job %s failed", job['name'])
+                summary = dict(name=job['name'], status='failed', error=repr(e))
+            summaries.append(summary)
+
+    if cache is not None:
+        cache.evict()
+
+    summaries.sort(key=lambda s: s['name'])
+    with open(os.path.join(output, 'jobs.json'), 'w') as f:
+        json.dump(summaries, f, indent=1)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('spec', help="job spec file (JSON or YAML)")
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summaries = run(args.spec, processes=args.processes)
+    return int(any(s['status'] != 'done' for s in summaries))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
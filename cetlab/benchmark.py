@@ -0,0 +1,253 @@
+"""
+Benchmarks of the site pipeline on synthetic ERA5-like data.
+
+Every stage of the pipeline runs on a synthetic cutout (see
+``cetlab.synthetic``) of configurable grid size, length and number of
+sites, so the suite runs offline and reproducibly:
+
+    prepare      months written into and read back from a CutoutCache
+    mapping      sites mapped to grid cells
+    pv, wind     site conversion
+    aggregation  zonal layout generation of all sites
+    statistics   one-pass profile statistics
+    write        profiles written to a Zarr store
+    plot         paginated profile figures
+
+Wall time and peak traced memory (numpy and Python allocations, via
+tracemalloc) are recorded per stage; tracing slows Python-heavy stages
+such as plotting down considerably, so memory is measured in a separate
+run from the timings. Each run appends one JSON line per
+configuration to the results file together with the git revision, so
+regressions between versions and scaling curves over grid size, hours or
+sites can be read back with ``load_results``.
+
+Run it with ``python -m cetlab.benchmark --sites 10 100 1000``.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .cache import CutoutCache
+from .convert import pv_generation, wind_generation, layout_generation
+from .layout import SparseLayout
+from .sites import map_sites
+from .stats import ProfileStatistics
+from .store import ProfileStore
+from .synthetic import synthetic_cutout, synthetic_sites, synthetic_fetch
+
+import logging
+logger = logging.getLogger(__name__)
+
+STAGES = ['prepare', 'mapping', 'pv', 'wind', 'aggregation', 'statistics', 'write', 'plot']
+
+
+def _revision():
+    "Short git revision of the checkout cetlab runs from, if any."
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+class _Timer(object):
+    "Collects wall time, or peak traced memory with ``trace``, of consecutive stages."
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.stages = {}
+
+    def __call__(self, name, func, *args, **kwds):
+        if self.trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwds)
+        finally:
+            seconds = time.perf_counter() - start
+            if self.trace:
+                result_key, value = 'peak_mb', tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+            else:
+                result_key, value = 'seconds', seconds
+        self.stages[name] = {result_key: value}
+        logger.info("%-12s %10.3f %s", name, value, 'MB' if self.trace else 's')
+        return result
+
+
+def run_pipeline(nx=40, ny=40, hours=744, sites=10, zones=4, plot_sites=20,
+                 stages=None, workdir=None, processes=1, trace=False):
+    """
+    Time every stage of the pipeline on one synthetic configuration.
+
+    ``sites`` sites are split into ``zones`` zones for the aggregation
+    stage; only the first ``plot_sites`` sites are plotted. ``stages``
+    restricts the run to a subset of ``STAGES`` (prepare and the
+    conversions always run as the later stages need their output, but
+    are only reported when selected). Returns the seconds, or with
+    ``trace`` the peak traced memory in MB, of every stage.
+    """
+    stages = STAGES if stages is None else stages
+    workdir = tempfile.mkdtemp(prefix='cetlab-bench-') if workdir is None else workdir
+    timer = _Timer(trace)
+    try:
+        source = synthetic_cutout(nx, ny, hours)
+        table = synthetic_sites(source, sites)
+        table['zone'] = ['zone_{}'.format(i % zones) for i in range(sites)]
+        xs = slice(source.indexes['x'].min(), source.indexes['x'].max())
+        ys = slice(source.indexes['y'].max(), source.indexes['y'].min())
+        time = source.indexes['time']
+
+        def prepare():
+            # One cache request per year, covering the months of that year
+            cache = CutoutCache(os.path.join(workdir, 'cache'), fetch=synthetic_fetch(source),
+                                require_complete=False)
+            parts = [cache.get('era5', xs, ys, slice(year, year),
+                               slice(time.month[time.year == year].min(),
+                                     time.month[time.year == year].max()))
+                     for year in np.unique(time.year)]
+            return xr.concat(parts, dim='time').load()
+
+        ds = timer('prepare', prepare)
+        timer('mapping', map_sites, ds, table)
+        pv = timer('pv', pv_generation, ds, table)
+        wind = timer('wind', wind_generation, ds, table)
+
+        if 'aggregation' in stages:
+            layout = SparseLayout.from_sites(ds, table, by='zone')
+            timer('aggregation', layout_generation, ds, layout, 'wind')
+        if 'statistics' in stages:
+            def statistics():
+                stats = ProfileStatistics(table)
+                stats.update(wind)
+                return stats.summary(), stats.monthly(), stats.diurnal()
+            timer('statistics', statistics)
+        if 'write' in stages:
+            timer('write', ProfileStore(os.path.join(workdir, 'profiles.zarr')).write, pv, table)
+        if 'plot' in stages:
+            from .plotting import plot_profiles
+            timer('plot', plot_profiles, pv.isel(site=slice(0, plot_sites)),
+                  os.path.join(workdir, 'plots'), table, processes=processes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {k: v for k, v in timer.stages.items() if k in stages}
+
+
+def benchmark(configs, output='benchmarks.jsonl', label=None, repeat=1, memory=True, **kwds):
+    """
+    Run ``run_pipeline`` for every configuration dict in ``configs``,
+    ``repeat`` times keeping the fastest run of every stage, plus one
+    traced run for the peak memory if ``memory`` is set, and append the
+    results to the JSON lines file ``output``. Returns the records.
+    """
+    meta = dict(revision=_revision(), label=label, python=platform.python_version(),
+                numpy=np.__version__, xarray=xr.__version__, machine=platform.node(),
+                cpus=os.cpu_count(),
+                timestamp=pd.Timestamp.now().isoformat(timespec='seconds'))
+    records = []
+    for config in configs:
+        logger.info("Benchmarking %s", config)
+        runs = [run_pipeline(**dict(kwds, **config)) for _ in range(repeat)]
+        stages = {s: dict(seconds=min(r[s]['seconds'] for r in runs)) for s in runs[0]}
+        if memory:
+            traced = run_pipeline(trace=True, **dict(kwds, **config))
+            for s in stages:
+                stages[s]['peak_mb'] = traced[s]['peak_mb']
+        records.append(dict(meta, config=config, stages=stages))
+        if output is not None:
+            with open(output, 'a') as f:
+                f.write(json.dumps(records[-1]) + '\n')
+    return records
+
+
+def load_results(path='benchmarks.jsonl'):
+    """
+    Benchmark results as a long DataFrame with one row per run and stage:
+    configuration, revision, label, timestamp, seconds and peak_mb.
+    """
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for stage, result in record['stages'].items():
+                rows.append(dict(record['config'], stage=stage,
+                                 revision=record.get('revision'), label=record.get('label'),
+                                 timestamp=record['timestamp'],
+                                 seconds=result['seconds'], peak_mb=result.get('peak_mb')))
+    return pd.DataFrame(rows)
+
+
+def compare(results, tolerance=0.2):
+    """
+    Latest run of every configuration and stage against the previous one.
+
+    Returns the rows whose time or peak memory grew by more than
+    ``tolerance`` (relative), the regressions.
+    """
+    keys = [c for c in results.columns if c not in
+            ('revision', 'label', 'timestamp', 'seconds', 'peak_mb')]
+    rows = []
+    for key, group in results.sort_values('timestamp').groupby(keys):
+        if len(group) < 2:
+            continue
+        previous, latest = group.iloc[-2], group.iloc[-1]
+        for metric in ('seconds', 'peak_mb'):
+            if pd.notnull(previous[metric]) and pd.notnull(latest[metric]) and \
+                    latest[metric] > (1. + tolerance) * previous[metric]:
+                rows.append(dict(zip(keys, key), metric=metric,
+                                 previous=previous[metric], latest=latest[metric],
+                                 previous_revision=previous['revision'],
+                                 latest_revision=latest['revision']))
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nx', type=int, nargs='+', default=[40], help="grid cells along x")
+    parser.add_argument('--ny', type=int, nargs='+', default=[40], help="grid cells along y")
+    parser.add_argument('--hours', type=int, nargs='+', default=[744], help="time steps")
+    parser.add_argument('--sites', type=int, nargs='+', default=[10], help="number of sites")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+                        help="stages to report (default: all)")
+    parser.add_argument('-n', '--repeat', type=int, default=1,
+                        help="runs per configuration, the fastest is kept")
+    parser.add_argument('-o', '--output', default='benchmarks.jsonl',
+                        help="JSON lines file the results are appended to")
+    parser.add_argument('--label', default=None, help="free-form label stored with the results")
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="skip the traced run measuring peak memory")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    configs = [dict(nx=nx, ny=ny, hours=hours, sites=sites)
+               for nx in args.nx for ny in args.ny
+               for hours in args.hours for sites in args.sites]
+    benchmark(configs, args.output, label=args.label, repeat=args.repeat,
+              memory=args.memory, stages=args.stages)
+
+    regressions = compare(load_results(args.output), args.tolerance)
+    if len(regressions):
+        print("Regressions against the previous run:")
+        print(regressions.to_string(index=False))
+    return int(len(regressions) > 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Content-addressed cache of prepared weather data.
+
+Preparing a cutout downloads and processes the weather data month by month,
+which takes a long time and fails when run twice on the same atlite cutout.
+The cache stores every prepared month as its own NetCDF entry, keyed by
+weather module, bounding box, year-month and variables. A request is served
+from the entries it overlaps: months that are cached for the same or a larger
+bounding box are sliced from disk and only the missing months are fetched.
+Entries are evicted least-recently-used first once the cache grows beyond
+``max_size`` bytes. The index is only read and written under a file lock,
+so several runs can share one cache directory.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from .convert import open_cutout, open_months
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _months(years, months):
+    "List of (year, month) pairs covered by atlite style year and month slices."
+    return [(y, m)
+            for y in range(years.start, years.stop + 1)
+            for m in range(months.start, months.stop + 1)]
+
+
+class IncompleteMonthError(ValueError):
+    "A fetched month does not hold every hour of the month (yet)."
+
+
+def _check_complete(path, year, month):
+    "Raise IncompleteMonthError unless ``path`` holds all hours of the month."
+    with open_cutout(path) as ds:
+        ntime = ds.sizes['time']
+    expected = 24 * pd.Period(year=year, month=month, freq='M').days_in_month
+    if ntime < expected:
+        raise IncompleteMonthError("Only {} of {} hours of {:04d}-{:02d} are available"
+                                   .format(ntime, expected, year, month))
+
+
+def _bbox(xs, ys):
+    "Normalized (xmin, ymin, xmax, ymax) of a pair of coordinate slices."
+    x0, x1 = sorted((float(xs.start), float(xs.stop)))
+    y0, y1 = sorted((float(ys.start), float(ys.stop)))
+    return (round(x0, 6), round(y0, 6), round(x1, 6), round(y1, 6))
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            outer[2] >= inner[2] and outer[3] >= inner[3])
+
+
+def select_bbox(ds, bbox):
+    "Cells of ``ds`` whose centers lie within ``bbox``, for any axis order."
+    x, y = ds.indexes['x'], ds.indexes['y']
+    return ds.isel(x=np.flatnonzero((x >= bbox[0]) & (x <= bbox[2])),
+                   y=np.flatnonzero((y >= bbox[1]) & (y <= bbox[3])))
+
+
+def atlite_fetch(module, bbox, year, month, variables, path):
+    """
+    Prepare one month with atlite in a scratch directory and store it at ``path``.
+
+    Only the requested variables are kept (all of them if ``variables`` is
+    None).
+    """
+    import atlite
+
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(path))
+    try:
+        cutout = atlite.Cutout(name='fetch', cutout_dir=tmpdir, module=module,
+                               xs=slice(bbox[0], bbox[2]),
+                               ys=slice(bbox[3], bbox[1]),
+                               years=slice(year, year),
+                               months=slice(month, month))
+        cutout.prepare()
+        with open_cutout(cutout) as ds:
+            if variables is not None:
+                ds = ds[list(variables)]
+            ds.load().to_netcdf(path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def open_entries(files, xs, ys, variables=None):
+    "Lazily open cache entries restricted to a bounding box and variables."
+    bbox = _bbox(xs, ys)
+
+    def preprocess(ds):
+        ds = select_bbox(ds, bbox)
+        return ds if variables is None else ds[list(variables)]
+
+    return open_months(files, preprocess=preprocess)
+
+
+class CutoutCache(object):
+    """
+    Cache of prepared weather months under ``cache_dir``.
+
+    ``fetch`` is called as ``fetch(module, bbox, year, month, variables,
+    path)`` for every month that is not cached yet and must write a NetCDF
+    file to ``path``; it defaults to preparing the month with atlite.
+    Months that come back with fewer than all of their hours, like the
+    latest month of ERA5, are not cached and raise IncompleteMonthError
+    unless ``require_complete`` is switched off.
+    """
+
+    index_name = 'index.json'
+    lock_name = 'index.lock'
+
+    def __init__(self, cache_dir, max_size=None, fetch=atlite_fetch, require_complete=True):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.fetch = fetch
+        self.require_complete = require_complete
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Index handling
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, self.index_name)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            index = json.load(f)
+        # Drop entries whose file went missing
+        return {k: e for k, e in index.items()
+                if os.path.exists(os.path.join(self.cache_dir, e['file']))}
+
+    @contextmanager
+    def _locked(self):
+        "Hold an exclusive lock on the index (a no-op without fcntl)."
+        with open(os.path.join(self.cache_dir, self.lock_name), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.index_path)
+
+    @staticmethod
+    def key(module, bbox, year, month, variables=None):
+        "Content address of one cached month."
+        spec = json.dumps([module, list(bbox), year, month,
+                           None if variables is None else sorted(variables)])
+        return hashlib.sha1(spec.encode()).hexdigest()
+
+    def size(self):
+        "Total size of the cached entries in bytes."
+        return sum(e['size'] for e in self._load_index().values())
+
+    # Lookup
+
+    def _lookup(self, index, module, bbox, year, month, variables):
+        "Key of the smallest cached entry covering the request, or None."
+        candidates = [
+            (k, e) for k, e in index.items()
+            if (e['module'] == module and e['year'] == year and
+                e['month'] == month and _contains(e['bbox'], bbox) and
+                (e['variables'] is None or
+                 (variables is not None and set(variables) <= set(e['variables']))))
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: c[1]['size'])[0]
+
+    def prepare(self, module, xs, ys, years, months, variables=None, evict=True):
+        """
+        Make sure every month of the cutout specification is cached.
+
+        Arguments follow ``atlite.Cutout``; months that are already cached are
+        not prepared again. With ``evict`` the size cap is enforced
+        afterwards, never removing the months of this request. Returns the
+        paths of the cache entries, one per month.
+        """
+        bbox = _bbox(xs, ys)
+        requested = _months(years, months)
+        with self._locked():
+            index = self._load_index()
+            missing = [(year, month) for year, month in requested
+                       if self._lookup(index, module, bbox, year, month, variables) is None]
+
+        # Fetching takes long, so it runs without the lock; every entry is
+        # added to the index as soon as it is complete
+        for year, month in missing:
+            key = self.key(module, bbox, year, month, variables)
+            fn = key + '.nc'
+            logger.info("Preparing %s %04d-%02d for %s", module, year, month, bbox)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.nc.tmp')
+            os.close(fd)
+            try:
+                self.fetch(module, bbox, year, month, variables, tmp)
+                if self.require_complete:
+                    _check_complete(tmp, year, month)
+                with self._locked():
+                    index = self._load_index()
+                    if self._lookup(index, module, bbox, year, month, variables) is not None:
+                        # Another run cached the month in the meantime
+                        continue
+                    os.replace(tmp, os.path.join(self.cache_dir, fn))
+                    index[key] = dict(file=fn, module=module, bbox=list(bbox),
+                                      year=year, month=month,
+                                      variables=None if variables is None else sorted(variables),
+                                      size=os.path.getsize(os.path.join(self.cache_dir, fn)),
+                                      last_access=time.time())
+                    self._save_index(index)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+        with self._locked():
+            index = self._load_index()
+            keys = []
+            for year, month in requested:
+                key = self._lookup(index, module, bbox, year, month, variables)
+                if key is None:
+                    raise RuntimeError("Cache entry of {} {:04d}-{:02d} disappeared while "
+                                       "preparing".format(module, year, month))
+                index[key]['last_access'] = time.time()
+                keys.append(key)
+            if evict:
+                self._evict(index, keep=set(keys))
+            self._save_index(index)
+        return [os.path.join(self.cache_dir, index[key]['file']) for key in keys]
+
+    def get(self, module, xs, ys, years, months, variables=None):
+        """
+        Weather data for the given cutout specification as an xarray Dataset.
+
+        Arguments follow ``atlite.Cutout``; calling this repeatedly is cheap
+        and never prepares a month twice.
+        """
+        files = self.prepare(module, xs, ys, years, months, variables)
+        return open_entries(files, xs, ys, variables)
+
+    # Eviction
+
+    def evict(self):
+        "Delete least recently used entries until the cache fits ``max_size``."
+        with self._locked():
+            index = self._load_index()
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index, keep=()):
+        if self.max_size is None:
+            return
+        total = sum(e['size'] for e in index.values())
+        for key in sorted(index, key=lambda k: index[k].get('last_access', 0.)):
+            if total <= self.max_size:
+                break
+            if key in keep:
+                continue
+            entry = index.pop(key)
+            logger.info("Evicting %s %04d-%02d from cutout cache",
+                        entry['module'], entry['year'], entry['month'])
+            os.remove(os.path.join(self.cache_dir, entry['file']))
+            total -= entry['size']
+
+    def clear(self):
+        "Remove all cached entries."
+        with self._locked():
+            index = self._load_index()
+            for entry in index.values():
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            self._save_index({})
@@ -0,0 +1,73 @@
+"""
+Cold-start cost of a conversion worker.
+
+Imports ``cetlab`` (or other modules) in fresh interpreters, as every batch
+or pool worker does, and reports the median import time together with any
+plotting or geo packages that got loaded on the way. Those packages belong
+to the visualization layer and must only be imported when a plot or a
+region is requested, so the check fails when one of them is loaded or the
+import takes longer than ``--max-time`` seconds.
+
+Run it with ``python -m cetlab.coldstart``.
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+import logging
+logger = logging.getLogger(__name__)
+
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'cartopy', 'folium', 'geopandas',
+                 'shapely', 'atlite']
+
+_CHILD = """
+import sys, time, json, importlib
+start = time.perf_counter()
+for module in {modules!r}:
+    importlib.import_module(module)
+print(json.dumps({{'time': time.perf_counter() - start,
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(modules=('cetlab',), repeat=5):
+    """
+    Import ``modules`` in ``repeat`` fresh interpreters. Returns the import
+    times in seconds and the heavy packages that were loaded.
+    """
+    code = _CHILD.format(modules=list(modules), heavy=HEAVY_MODULES)
+    times, loaded = [], set()
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                             check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded.update(result['loaded'])
+    return dict(times=times, loaded=sorted(loaded))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('modules', nargs='*', default=['cetlab'],
+                        help="modules a worker imports (default: cetlab)")
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help="number of fresh interpreters (default: 5)")
+    parser.add_argument('--max-time', type=float, default=None,
+                        help="fail if the median import takes longer (seconds)")
+    args = parser.parse_args(argv)
+
+    result = measure(args.modules, args.repeat)
+    times = sorted(result['times'])
+    median = times[len(times) // 2]
+    print("import {}: median {:.3f}s, min {:.3f}s, max {:.3f}s over {} runs"
+          .format(', '.join(args.modules), median, times[0], times[-1], len(times)))
+    if result['loaded']:
+        print("heavy packages loaded: {}".format(', '.join(result['loaded'])))
+    slow = args.max_time is not None and median > args.max_time
+    return int(bool(result['loaded']) or slow)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Site-level conversion engine.
+
+Instead of running a full-grid ``cutout.pv`` / ``cutout.wind`` call per site
+and cutting one cell out of it with a polygon, the weather data of all cells
+that hold a site is gathered once and converted in a single vectorized pass.
+The result is one (site, time) array for an arbitrary number of sites.
+
+A site table is a (Geo)DataFrame indexed by site name with the columns
+``x``, ``y`` (lon/lat in degrees) and ``capacity`` (MW); PV site tables may
+additionally hold an orientation per site (``optimal slope``,
+``optimal azimuthal``).
+"""
+
+import os
+from glob import glob
+
+import numpy as np
+import xarray as xr
+
+from .pv import convert_pv, group_orientations, project_pv, solar_position
+from .wind import convert_wind
+from .sites import map_sites
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+PV_VARIABLES = ['influx_direct', 'influx_diffuse', 'albedo', 'temperature']
+WIND_VARIABLES = ['roughness']
+
+
+def open_cutout(cutout):
+    """
+    Return the weather data of ``cutout`` as a lazily loaded xarray Dataset.
+
+    ``cutout`` can be an atlite Cutout, the directory of a prepared cutout
+    (one NetCDF file per month), a single NetCDF file or a Dataset.
+    """
+    if isinstance(cutout, xr.Dataset):
+        return cutout
+    if isinstance(getattr(cutout, 'data', None), xr.Dataset):
+        return cutout.data
+
+    path = getattr(cutout, 'cutout_dir', cutout)
+    if os.path.isdir(path):
+        files = sorted(glob(os.path.join(path, '[0-9]' * 6 + '.nc')))
+        if not files:
+            raise FileNotFoundError("No prepared monthly files in '{}'. "
+                                    "Run cutout.prepare() first.".format(path))
+        return open_months(files)
+    return xr.open_dataset(path)
+
+
+def open_months(files, preprocess=None):
+    "Lazily open a sequence of monthly NetCDF files as one Dataset along time."
+    return xr.open_mfdataset(files, combine='by_coords', preprocess=preprocess,
+                             data_vars='minimal', coords='minimal',
+                             compat='override')
+
+
+def gather(ds, iy, ix, variables):
+    "Load ``variables`` at the grid cells (iy, ix) into a (time, cell) Dataset."
+    sub = ds[variables].isel(y=xr.DataArray(np.asarray(iy), dims='cell'),
+                             x=xr.DataArray(np.asarray(ix), dims='cell'))
+    if 'lon' not in sub.coords:
+        sub = sub.rename(x='lon', y='lat')
+    return sub.transpose('time', 'cell').load()
+
+
+def gather_cells(ds, sites, variables):
+    """
+    Load ``variables`` for the cells holding ``sites`` into a (time, cell) Dataset.
+
+    Sites sharing a cell are served by a single column. Returns the gathered
+    Dataset together with the column index of every site.
+    """
+    mapping = map_sites(ds, sites)
+    cells, first, site_cell = np.unique(mapping['cell'].values, return_index=True,
+                                        return_inverse=True)
+    sub = gather(ds, mapping['iy'].values[first], mapping['ix'].values[first],
+                 variables)
+    return sub, site_cell.ravel()
+
+
+def wind_variables(ds):
+    "Variables of ``ds`` needed for the wind conversion."
+    return WIND_VARIABLES + [v for v in ds.data_vars
+                             if v.startswith('wnd') and v.endswith('m')]
+
+
+def _to_sites_array(values, time, sites, capacity_factor):
+    "Wrap (time, site) per-unit output into a (site, time) DataArray."
+    if capacity_factor:
+        name, units = 'capacity factor', 'p.u.'
+    else:
+        values = values * np.asarray(sites['capacity'], dtype=float)
+        name, units = 'generation', 'MW'
+    return xr.DataArray(values.T, dims=('site', 'time'),
+                        coords={'site': np.asarray(sites.index), 'time': time},
+                        name=name, attrs={'units': units})
+
+
+def pv_generation(cutout, sites, panel='CdTe', orientation=None,
+                  capacity_factor=False, slope='optimal slope',
+                  azimuth='optimal azimuthal'):
+    """
+    PV generation of every site in ``sites`` as a (site, time) DataArray.
+
+    Each site uses its own orientation from the ``slope`` and ``azimuth``
+    columns unless a common ``orientation`` dict (keys ``slope`` and
+    ``azimuth``) is given. Solar geometry is computed once per cell and
+    sites sharing a cell and orientation are evaluated together. Output is
+    in MW, scaled by the ``capacity`` column, or per-unit if
+    ``capacity_factor`` is set.
+    """
+    ds = open_cutout(cutout)
+    sub, site_cell = gather_cells(ds, sites, PV_VARIABLES)
+
+    if orientation is None:
+        site_slope = np.asarray(sites[slope], dtype=float)
+        site_azimuth = np.asarray(sites[azimuth], dtype=float)
+    else:
+        site_slope, site_azimuth = orientation['slope'], orientation['azimuth']
+
+    sun = solar_position(sub.indexes['time'], sub['lon'].values, sub['lat'].values)
+    (cell, group_slope, group_azimuth), site_group = \
+        group_orientations(site_cell, site_slope, site_azimuth)
+    logger.debug("Projecting %d orientation groups for %d sites",
+                 len(cell), len(site_group))
+
+    values = project_pv(sub, sun, panel, group_slope, group_azimuth, cell=cell)
+    return _to_sites_array(values[:, site_group], sub.indexes['time'], sites,
+                           capacity_factor)
+
+
+def wind_generation(cutout, sites, turbine='Vestas_V112_3MW',
+                    capacity_factor=False):
+    """
+    Wind generation of every site in ``sites`` as a (site, time) DataArray.
+
+    Output is in MW, scaled by the ``capacity`` column, or per-unit if
+    ``capacity_factor`` is set.
+    """
+    ds = open_cutout(cutout)
+    sub, site_cell = gather_cells(ds, sites, wind_variables(ds))
+
+    values = convert_wind(sub, turbine)[:, site_cell]
+    return _to_sites_array(values, sub.indexes['time'], sites, capacity_factor)
+
+
+def layout_generation(cutout, layout, technology, capacity_factor=False,
+                      panel='CdTe', orientation=None, turbine='Vestas_V112_3MW'):
+    """
+    Generation of every group of a ``SparseLayout`` as a (group, time) DataArray.
+
+    Only the cells with installed capacity are loaded and converted, and the
+    groups are summed with a sparse matrix product. ``technology`` is 'pv',
+    which needs a common ``orientation`` dict (keys ``slope`` and
+    ``azimuth``), or 'wind'. Output is in MW, or per-unit of the group
+    capacity if ``capacity_factor`` is set.
+    """
+    ds = open_cutout(cutout)
+    if (ds.sizes['y'], ds.sizes['x']) != layout.shape:
+        raise ValueError("Layout of shape {} does not match the cutout grid {}"
+                         .format(layout.shape, (ds.sizes['y'], ds.sizes['x'])))
+
+    iy, ix = layout.cell_indices()
+    if technology == 'pv':
+        if orientation is None:
+            raise ValueError("PV layouts need an orientation")
+        sub = gather(ds, iy, ix, PV_VARIABLES)
+        per_unit = convert_pv(sub, panel, orientation['slope'], orientation['azimuth'])
+    elif technology == 'wind':
+        sub = gather(ds, iy, ix, wind_variables(ds))
+        per_unit = convert_wind(sub, turbine)
+    else:
+        raise ValueError("Unknown technology '{}'".format(technology))
+
+    values = layout.aggregate(per_unit)
+    if capacity_factor:
+        values = values / layout.capacity.values[:, np.newaxis]
+        name, units = 'capacity factor', 'p.u.'
+    else:
+        name, units = 'generation', 'MW'
+    return xr.DataArray(values, dims=(layout.index.name or 'group', 'time'),
+                        coords={layout.index.name or 'group': layout.index,
+                                'time': sub.indexes['time']},
+                        name=name, attrs={'units': units})
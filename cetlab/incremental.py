@@ -0,0 +1,123 @@
+"""
+Incremental updates of stored profiles.
+
+A manifest next to the profile store records, for every store group, the
+sites (names and a digest of their positions, capacities and
+orientations), technology and conversion parameters it was built with and how far in
+time it has been computed. An update converts only the time steps after
+that point and appends them chunk by chunk, saving the manifest after each
+chunk as a checkpoint. An interrupted update resumes after the last
+completed chunk, so a monthly refresh costs one month of conversion.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .convert import open_cutout
+from .streaming import stream_generation
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Manifest(object):
+    "JSON record of what every group of a profile store holds."
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def save(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                   suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _site_digest(sites, kwds):
+    "Digest of the site columns the conversion reads: position, capacity, orientation."
+    columns = ['x', 'y', 'capacity', kwds.get('slope', 'optimal slope'),
+               kwds.get('azimuth', 'optimal azimuthal')]
+    h = hashlib.sha1()
+    for c in columns:
+        if c in sites:
+            h.update(str(c).encode())
+            h.update(np.round(np.asarray(sites[c], dtype=float), 6).tobytes())
+    return h.hexdigest()
+
+
+def _signature(sites, technology, kwds):
+    "What a store group was computed from; appends must match it."
+    return dict(technology=technology,
+                sites=[str(s) for s in sites.index],
+                site_digest=_site_digest(sites, kwds),
+                parameters=json.loads(json.dumps(kwds, sort_keys=True, default=str)))
+
+
+def update_profiles(cutout, sites, technology, store, manifest=None, freq='M',
+                    **kwds):
+    """
+    Bring the profiles in ``store`` (a ``ProfileStore``) up to date with ``cutout``.
+
+    Only time steps after the last recorded one are converted, ``freq``
+    chunk by chunk, and appended; the manifest (default ``manifest.json``
+    inside the store) is saved after every chunk. Keyword arguments are
+    passed on to the conversion and must stay the same between updates of
+    one store group. Returns the number of time steps added.
+    """
+    if manifest is None:
+        os.makedirs(store.path, exist_ok=True)
+        manifest = os.path.join(store.path, 'manifest.json')
+    manifest = Manifest(manifest)
+    key = store.group or '/'
+
+    signature = _signature(sites, technology, kwds)
+    entry = manifest.entries.get(key)
+    if entry is not None and store.exists():
+        # Entries written before the site digest was recorded only check names
+        entry.setdefault('site_digest', signature['site_digest'])
+        if {k: entry[k] for k in signature} != signature:
+            raise ValueError("Store group '{}' was computed for other sites or "
+                             "parameters; write to a new group instead".format(key))
+        stored = store.open().sizes['time']
+        if stored > entry['ntime']:
+            logger.warning("Discarding %d time steps of an interrupted update of '%s'",
+                           stored - entry['ntime'], key)
+            store.truncate(entry['ntime'])
+    else:
+        entry = dict(signature, ntime=0, start=None, end=None)
+
+    ds = open_cutout(cutout)
+    if entry['end'] is not None:
+        time = ds.indexes['time']
+        ds = ds.isel(time=time > pd.Timestamp(entry['end']))
+    if ds.sizes['time'] == 0:
+        logger.info("Profiles in '%s' are up to date until %s", key, entry['end'])
+        return 0
+
+    added = 0
+    for chunk in stream_generation(ds, sites, technology, freq=freq, **kwds):
+        if entry['ntime'] == 0:
+            store.write(chunk, sites)
+            entry['start'] = str(chunk.indexes['time'][0])
+        else:
+            store.append(chunk)
+        entry['ntime'] += chunk.sizes['time']
+        entry['end'] = str(chunk.indexes['time'][-1])
+        added += chunk.sizes['time']
+
+        manifest.entries[key] = entry
+        manifest.save()
+        logger.info("Appended %s to '%s' until %s", technology, key, entry['end'])
+
+    return added
@@ -0,0 +1,107 @@
+"""
+Sparse capacity layouts.
+
+A layout holds the installed capacity (MW) per grid cell for one or more
+groups of plants, e.g. one group per site or per zone. It is stored as a
+sparse (group, cell) matrix over the flattened (y, x) grid, so memory and the
+cost of aggregation grow with the number of installed cells rather than the
+size of the cutout grid.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .sites import map_sites
+
+
+class SparseLayout(object):
+    """
+    Installed capacity per grid cell for every group in ``index``.
+
+    ``matrix`` has one row per group and one column per cell of a grid of
+    ``shape`` (ny, nx), flattened in row-major order.
+    """
+
+    def __init__(self, matrix, shape, index=None):
+        import scipy.sparse as sp
+        self.matrix = sp.csr_matrix(matrix, dtype=float)
+        self.shape = tuple(shape)
+        if self.matrix.shape[1] != self.shape[0] * self.shape[1]:
+            raise ValueError("Layout matrix has {} columns, grid of shape {} "
+                             "has {} cells".format(self.matrix.shape[1], self.shape,
+                                                   self.shape[0] * self.shape[1]))
+        if index is None:
+            index = pd.RangeIndex(self.matrix.shape[0], name='group')
+        self.index = pd.Index(index)
+
+        # Only the columns of cells with installed capacity take part in
+        # aggregation
+        self.cells = np.unique(self.matrix.indices)
+        self._compressed = self.matrix[:, self.cells].tocsr()
+
+    @classmethod
+    def from_sites(cls, ds, sites, by=None):
+        """
+        Layout of the ``capacity`` column of a site table on the grid of ``ds``.
+
+        Every site is its own group unless ``by`` (a column name or a Series
+        mapping site to group) collects them, e.g. by zone. Sites sharing a
+        cell and group are summed.
+        """
+        import scipy.sparse as sp
+        mapping = map_sites(ds, sites)
+        if by is None:
+            index, rows = pd.Index(sites.index, name='site'), np.arange(len(sites))
+        else:
+            groups = sites[by] if isinstance(by, str) else by.reindex(sites.index)
+            index, rows = np.unique(np.asarray(groups), return_inverse=True)
+            index = pd.Index(index, name=groups.name)
+
+        matrix = sp.coo_matrix((np.asarray(sites['capacity'], dtype=float),
+                                (rows.ravel(), mapping['cell'].values)),
+                               shape=(len(index), ds.sizes['y'] * ds.sizes['x']))
+        return cls(matrix, (ds.sizes['y'], ds.sizes['x']), index=index)
+
+    @classmethod
+    def from_weights(cls, weights, capacity=1.):
+        """
+        Layout of (group, y, x) or (y, x) cell ``weights``, e.g. region
+        masks from ``MaskStore.get_many``, scaled by ``capacity`` per cell.
+
+        With the default capacity the per-unit output of a layout is the
+        weighted mean over the cells of every group.
+        """
+        import scipy.sparse as sp
+        if weights.ndim == 2:
+            weights = weights.expand_dims(group=[weights.name or 0])
+        dim = [d for d in weights.dims if d not in ('y', 'x')][0]
+        weights = weights.fillna(0.).transpose(dim, 'y', 'x')
+        shape = weights.shape[1:]
+        matrix = sp.csr_matrix(weights.values.reshape(len(weights), -1) * capacity)
+        return cls(matrix, shape, index=weights.indexes[dim])
+
+    @property
+    def capacity(self):
+        "Total installed capacity per group."
+        return pd.Series(np.asarray(self.matrix.sum(axis=1)).ravel(), index=self.index)
+
+    def cell_indices(self):
+        "(iy, ix) grid indices of the cells with installed capacity."
+        return np.unravel_index(self.cells, self.shape)
+
+    def aggregate(self, per_unit):
+        """
+        Capacity-weighted sum of per-unit output for every group.
+
+        ``per_unit`` is a (time, cell) array over ``self.cells``. Returns a
+        (group, time) array computed as a sparse matrix product.
+        """
+        return np.asarray(self._compressed @ np.asarray(per_unit).T)
+
+    def to_dataarray(self, ds):
+        "Dense (y, x) map of the total installed capacity, NaN where empty."
+        total = np.asarray(self.matrix.sum(axis=0)).reshape(self.shape)
+        return xr.DataArray(np.where(total > 0., total, np.nan),
+                            coords={'y': ds['y'], 'x': ds['x']}, dims=('y', 'x'),
+                            name='Installed Capacity [MW]')
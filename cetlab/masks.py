@@ -0,0 +1,167 @@
+"""
+Region masks on the cutout grid.
+
+Named regions (Natural Earth countries by default, or any shape such as a
+zone) are rasterized to the fraction of every cell they cover once per
+grid and kept on disk by ``MaskStore``, so later conversions and screening
+runs skip parsing shapefiles and intersecting geometries.
+"""
+
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+import xarray as xr
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_MASK_DIR = os.environ.get(
+    'CETLAB_MASK_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cetlab', 'masks'))
+
+
+def _union(geometry):
+    "Single shapely geometry from a geometry, GeoSeries or list of geometries."
+    if hasattr(geometry, 'union_all'):
+        return geometry.union_all()
+    if hasattr(geometry, 'unary_union'):
+        return geometry.unary_union
+    if isinstance(geometry, (list, tuple)):
+        from shapely.ops import unary_union
+        return unary_union(geometry)
+    return geometry
+
+
+def _contains_xy(geometry, x, y):
+    "Vectorized point-in-geometry test on a prepared geometry."
+    try:
+        import shapely
+        from shapely import contains_xy
+    except ImportError:
+        from shapely.vectorized import contains as contains_xy
+    else:
+        shapely.prepare(geometry)
+    return contains_xy(geometry, x, y)
+
+
+def rasterize(ds, geometry):
+    """
+    Boolean (y, x) mask of the cells of ``ds`` whose center lies in ``geometry``.
+    """
+    x, y = np.meshgrid(ds['x'].values, ds['y'].values)
+    inside = _contains_xy(_union(geometry), x, y)
+    return xr.DataArray(inside, coords={'y': ds['y'], 'x': ds['x']}, dims=('y', 'x'))
+
+
+def cell_weights(ds, geometry, subdivisions=4):
+    """
+    Fraction of every (y, x) cell of ``ds`` covered by ``geometry``.
+
+    Each cell is sampled on a ``subdivisions`` x ``subdivisions`` grid of
+    points, so the fraction is exact to 1 / subdivisions**2.
+    """
+    offsets = (np.arange(subdivisions) + 0.5) / subdivisions - 0.5
+    x, y = ds['x'].values, ds['y'].values
+    width = np.gradient(x) if len(x) > 1 else np.ones(1)
+    height = np.gradient(y) if len(y) > 1 else np.ones(1)
+    px = x[:, None] + width[:, None] * offsets    # (nx, s)
+    py = y[:, None] + height[:, None] * offsets   # (ny, s)
+    X = np.broadcast_to(px[None, None, :, :], (len(y), subdivisions, len(x), subdivisions))
+    Y = np.broadcast_to(py[:, :, None, None], X.shape)
+    inside = _contains_xy(_union(geometry), X.ravel(), Y.ravel()).reshape(X.shape)
+    return xr.DataArray(inside.mean(axis=(1, 3)).astype('float32'),
+                        coords={'y': ds['y'], 'x': ds['x']}, dims=('y', 'x'),
+                        name='weight')
+
+
+def natural_earth(name, resolution='10m', category='cultural',
+                  layer='admin_0_countries', attribute='NAME_EN'):
+    """
+    Geometry of the Natural Earth record(s) whose ``attribute`` is ``name``,
+    e.g. ``natural_earth('South Africa')``.
+    """
+    import cartopy.io.shapereader as shpreader
+
+    reader = shpreader.Reader(shpreader.natural_earth(resolution=resolution,
+                                                      category=category, name=layer))
+    geometries = [r.geometry for r in reader.records() if r.attributes[attribute] == name]
+    if not geometries:
+        raise KeyError("No Natural Earth {} record with {} '{}'".format(layer, attribute, name))
+    return _union(geometries)
+
+
+class MaskStore(object):
+    """
+    On-disk store of region cell weights, keyed by grid and region.
+
+    ``get(ds, region)`` rasterizes the region with ``cell_weights`` the
+    first time it is requested for the grid of ``ds`` and reads it from
+    ``directory`` afterwards. Named regions are loaded with ``loader``
+    (Natural Earth countries by default); other shapes, e.g. zones, are
+    passed as ``geometry`` together with a name.
+    """
+
+    def __init__(self, directory=None, loader=natural_earth, subdivisions=4):
+        self.directory = directory or DEFAULT_MASK_DIR
+        self.loader = loader
+        self.subdivisions = subdivisions
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, ds, region, geometry=None):
+        "Content address of the weights of ``region`` on the grid of ``ds``."
+        h = hashlib.sha1()
+        for coord in ('x', 'y'):
+            h.update(np.round(ds[coord].values.astype(float), 6).tobytes())
+        h.update(repr((region, self.subdivisions)).encode())
+        if geometry is not None:
+            h.update(_union(geometry).wkb)
+        return h.hexdigest()
+
+    def path(self, ds, region, geometry=None):
+        return os.path.join(self.directory, self.key(ds, region, geometry) + '.npy')
+
+    def get(self, ds, region, geometry=None):
+        "(y, x) DataArray of the fraction of every cell covered by ``region``."
+        path = self.path(ds, region, geometry)
+        if os.path.exists(path):
+            values = np.load(path)
+        else:
+            logger.info("Rasterizing region '%s' on a %dx%d grid", region,
+                        ds.sizes['y'], ds.sizes['x'])
+            shape = self.loader(region) if geometry is None else geometry
+            values = cell_weights(ds, shape, self.subdivisions).values
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.npy')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp, path)
+        return xr.DataArray(values, coords={'y': ds['y'], 'x': ds['x']},
+                            dims=('y', 'x'), name=region)
+
+    def get_many(self, ds, regions, geometries=None):
+        """
+        (region, y, x) weights of several regions; ``geometries`` optionally
+        maps region names to shapes.
+        """
+        geometries = geometries or {}
+        weights = [self.get(ds, r, geometries.get(r)) for r in regions]
+        return xr.concat(weights, dim='region').assign_coords(region=list(regions))\
+                 .rename('weight')
+
+
+def as_mask(ds, region):
+    """
+    Boolean (y, x) mask from ``region``.
+
+    ``region`` is a geometry (or GeoSeries), a (y, x) DataArray of booleans
+    or weights, the name of a region in the default ``MaskStore`` (cells
+    it touches), or None for the whole grid.
+    """
+    if region is None:
+        return xr.DataArray(np.ones((ds.sizes['y'], ds.sizes['x']), dtype=bool),
+                            coords={'y': ds['y'], 'x': ds['x']}, dims=('y', 'x'))
+    if isinstance(region, str):
+        region = MaskStore().get(ds, region)
+    if isinstance(region, xr.DataArray):
+        return (region.fillna(0) > 0).transpose('y', 'x')
+    return rasterize(ds, region)
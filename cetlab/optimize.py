@@ -0,0 +1,105 @@
+"""
+Yield-maximizing PV orientation per site.
+
+All (slope, azimuth) candidates of a grid are evaluated for every site at
+once: solar geometry is computed once per time chunk and cell, and the
+candidates are projected as one broadcast NumPy operation. Large site sets
+are split into batches of cells that are evaluated in a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .convert import PV_VARIABLES, gather_cells, open_cutout
+from .pv import project_pv, solar_position
+from .screening import latitude_orientation
+from .streaming import time_chunks
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _candidate_yield(sub, panel, slope, azimuth):
+    """
+    Summed per-unit output of every candidate orientation of every cell.
+
+    ``slope`` and ``azimuth`` have shape (cell, candidate); returns an array
+    of the same shape.
+    """
+    ncell, ncand = slope.shape
+    sun = solar_position(sub.indexes['time'], sub['lon'].values, sub['lat'].values)
+    values = project_pv(sub, sun, panel, slope.ravel(), azimuth.ravel(),
+                        cell=np.repeat(np.arange(ncell), ncand))
+    return values.sum(axis=0).reshape(ncell, ncand)
+
+
+def optimal_orientation(cutout, sites, panel='CdTe', slopes=None,
+                        azimuth_offsets=None, freq='M', max_elements=5e7,
+                        processes=None):
+    """
+    Orientation with the highest PV yield for every site of ``sites``.
+
+    Candidates are every combination of ``slopes`` (degrees, default 0 to 60
+    in steps of 2) and ``azimuth_offsets`` from the equator-facing direction
+    (degrees, default -60 to 60 in steps of 10). Cells are evaluated in
+    batches of at most ``max_elements`` values per time chunk, spread over
+    ``processes`` worker processes (all cores by default when there is more
+    than one batch). Returns a DataFrame indexed like ``sites`` with the
+    columns ``optimal slope``, ``optimal azimuthal`` and the resulting
+    ``mean cf``.
+    """
+    if slopes is None:
+        slopes = np.arange(0., 61., 2.)
+    if azimuth_offsets is None:
+        azimuth_offsets = np.arange(-60., 61., 10.)
+    # Equator-facing candidates first, so ties (e.g. flat panels) resolve to them
+    azimuth_offsets = sorted(np.ravel(azimuth_offsets), key=abs)
+    slopes, offsets = [np.ravel(a).astype(float)
+                       for a in np.meshgrid(slopes, azimuth_offsets, indexing='ij')]
+    ncand = len(slopes)
+
+    ds = open_cutout(cutout)
+    sub, site_cell = gather_cells(ds.isel(time=slice(0, 1)), sites, PV_VARIABLES)
+    lat = sub['lat'].values
+    ncell = len(lat)
+
+    _, equator = latitude_orientation(lat)
+    cand_slope = np.broadcast_to(slopes, (ncell, ncand))
+    cand_azimuth = np.mod(equator[:, np.newaxis] + offsets, 360.)
+
+    time_per_chunk = max(len(c.indexes['time']) for c in time_chunks(ds, freq))
+    batch = max(1, int(max_elements // (time_per_chunk * ncand)))
+    batches = [slice(i, i + batch) for i in range(0, ncell, batch)]
+    if processes is None:
+        processes = os.cpu_count() if len(batches) > 1 else 1
+    logger.info("Evaluating %d orientations for %d cells in %d batches",
+                ncand, ncell, len(batches))
+
+    total = np.zeros((ncell, ncand))
+    n = 0
+    executor = ProcessPoolExecutor(processes) if processes > 1 else None
+    try:
+        for chunk in time_chunks(ds, freq):
+            sub, _ = gather_cells(chunk, sites, PV_VARIABLES)
+            args = [(sub.isel(cell=b), panel, cand_slope[b], cand_azimuth[b])
+                    for b in batches]
+            if executor is None:
+                results = [_candidate_yield(*a) for a in args]
+            else:
+                results = executor.map(_candidate_yield, *zip(*args))
+            for b, result in zip(batches, results):
+                total[b] += result
+            n += len(sub.indexes['time'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    best = total.argmax(axis=1)
+    cells = np.arange(ncell)
+    return pd.DataFrame({'optimal slope': cand_slope[cells, best][site_cell],
+                         'optimal azimuthal': cand_azimuth[cells, best][site_cell],
+                         'mean cf': (total[cells, best] / n)[site_cell]},
+                        index=sites.index)
@@ -0,0 +1,187 @@
+"""
+Representative days for capacity-expansion inputs.
+
+Hourly (site, time) profiles and the load are cut into days, each day
+becoming one feature vector of all sites' and the load's 24 hourly values.
+The days are clustered with k-means (mini-batch for long inputs) and every
+cluster is represented by the calendar day closest to its centre, so
+representative days stay physically consistent across sites and load.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .analysis import _as_load
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def daily_features(profiles, load=None, load_weight=1., dtype='float32'):
+    """
+    Day-by-feature matrix of (site, time) ``profiles`` and optional ``load``.
+
+    Only complete days of 24 hourly steps are kept. Profiles are used as
+    given (per unit), the load is divided by its peak and scaled so that
+    with ``load_weight=1`` it weighs as much as all sites together.
+    Returns the (day, feature) array, the days and the (site, day, hour)
+    and (day, hour) arrays.
+    """
+    profiles = profiles.transpose('site', 'time')
+    if load is not None:
+        profiles, load = xr.align(profiles, _as_load(load), join='inner', exclude=())
+
+    time = profiles.indexes['time']
+    day = time.floor('D')
+    counts = pd.Series(1, index=time).groupby(day).count()
+    complete = counts.index[counts == 24].rename('day')
+    keep = day.isin(complete)
+    if (~keep).any():
+        logger.info("Dropping %d time steps of incomplete days", (~keep).sum())
+
+    nsites, ndays = profiles.sizes['site'], len(complete)
+    site_days = profiles.values[:, keep].reshape(nsites, ndays, 24).astype(dtype)
+    features = [site_days.transpose(1, 0, 2).reshape(ndays, nsites * 24)]
+    load_days = None
+    if load is not None:
+        load_days = load.values[keep].reshape(ndays, 24).astype(dtype)
+        scale = load_weight * np.sqrt(nsites) / np.abs(load_days).max()
+        features.append(load_days * scale)
+    return np.concatenate(features, axis=1), complete, site_days, load_days
+
+
+def _sq_distances(x, centres):
+    "Squared euclidean distances (n, k), without an (n, k, features) temporary."
+    d = (x ** 2).sum(axis=1)[:, None] - 2 * x @ centres.T + (centres ** 2).sum(axis=1)[None, :]
+    return np.maximum(d, 0.)
+
+
+def _assign(x, centres, chunk=4096):
+    "Nearest centre and squared distance for every row of ``x``, in chunks."
+    labels = np.empty(len(x), dtype=int)
+    dist = np.empty(len(x))
+    for i in range(0, len(x), chunk):
+        d = _sq_distances(x[i:i + chunk], centres)
+        labels[i:i + chunk] = d.argmin(axis=1)
+        dist[i:i + chunk] = d[np.arange(len(d)), labels[i:i + chunk]]
+    return labels, dist
+
+
+def _init_centres(x, k, rng):
+    "k-means++ seeding."
+    centres = [x[rng.integers(len(x))]]
+    dist = _sq_distances(x, np.asarray(centres))[:, 0]
+    for _ in range(1, k):
+        p = dist / dist.sum() if dist.sum() > 0 else None
+        centres.append(x[rng.choice(len(x), p=p)])
+        dist = np.minimum(dist, _sq_distances(x, centres[-1][None, :])[:, 0])
+    return np.array(centres)
+
+
+def kmeans(x, k, batch_size=None, max_iter=100, tol=1e-6, seed=0):
+    """
+    Cluster the rows of ``x`` into ``k`` groups.
+
+    With ``batch_size`` the centres are updated from random mini-batches of
+    rows with per-centre learning rates (Sculley, 2010), so the cost per
+    iteration does not grow with the number of days; otherwise Lloyd
+    iterations run on all rows. Returns the (k, features) centres and the
+    label of every row.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x)
+    if k > len(x):
+        raise ValueError("Cannot form {} clusters from {} days".format(k, len(x)))
+    centres = _init_centres(x, k, rng).astype(x.dtype)
+
+    if batch_size is None:
+        labels = None
+        for it in range(max_iter):
+            new_labels, _ = _assign(x, centres)
+            if labels is not None and (new_labels == labels).all():
+                break
+            labels = new_labels
+            for c in range(k):
+                members = labels == c
+                if members.any():
+                    centres[c] = x[members].mean(axis=0)
+    else:
+        counts = np.zeros(k)
+        for it in range(max_iter):
+            batch = x[rng.choice(len(x), size=min(batch_size, len(x)), replace=False)]
+            labels, _ = _assign(batch, centres)
+            old = centres.copy()
+            for c in np.unique(labels):
+                members = batch[labels == c]
+                counts[c] += len(members)
+                rate = len(members) / counts[c]
+                centres[c] += rate * (members.mean(axis=0) - centres[c])
+            if np.abs(centres - old).max() < tol:
+                break
+    logger.debug("k-means stopped after %d iterations", it + 1)
+    labels, _ = _assign(x, centres)
+    return centres, labels
+
+
+def _medoids(x, centres, labels):
+    "Index of the member closest to each centre; empty clusters are dropped."
+    medoids = []
+    for c in range(len(centres)):
+        members = np.flatnonzero(labels == c)
+        if len(members):
+            d = _sq_distances(x[members], centres[c][None, :])[:, 0]
+            medoids.append(members[d.argmin()])
+    return np.array(medoids)
+
+
+def representative_days(profiles, load=None, n_days=12, load_weight=1.,
+                        batch_size=None, max_iter=100, seed=0):
+    """
+    Reduce (site, time) ``profiles`` and ``load`` to ``n_days`` typical days.
+
+    Days are clustered jointly on all sites and the load; each cluster is
+    represented by its medoid, the calendar day closest to the cluster
+    centre. Use ``batch_size`` (e.g. 1024 days) for mini-batch clustering of
+    multi-decade inputs.
+
+    Returns a Dataset over (period, site, hour) with the representative
+    'profiles', 'load', the 'date' of each period and its 'weight' (number
+    of days it stands for), and the 'period' of every calendar 'day'.
+    """
+    x, days, site_days, load_days = daily_features(profiles, load, load_weight)
+    centres, labels = kmeans(x, n_days, batch_size=batch_size,
+                             max_iter=max_iter, seed=seed)
+    medoids = _medoids(x, centres, labels)
+
+    # Re-assign every day to the nearest medoid, as the medoids represent it
+    periods, _ = _assign(x, x[medoids])
+    weight = np.bincount(periods, minlength=len(medoids))
+    logger.info("Represented %d days by %d periods", len(days), len(medoids))
+
+    data = {'profiles': (('period', 'site', 'hour'), site_days[:, medoids].transpose(1, 0, 2)),
+            'date': ('period', days[medoids]),
+            'weight': ('period', weight),
+            'assignment': ('day', periods)}
+    if load_days is not None:
+        data['load'] = (('period', 'hour'), load_days[medoids])
+    return xr.Dataset(data, coords={'period': np.arange(len(medoids)),
+                                    'site': profiles['site'].values,
+                                    'hour': np.arange(24),
+                                    'day': days})
+
+
+def reconstruct(periods, variable='profiles'):
+    """
+    Hourly series rebuilt from representative days, e.g. to check the
+    reduction error against the original profiles.
+    """
+    da = periods[variable]
+    other = [d for d in da.dims if d not in ('period', 'hour')]
+    values = da.transpose('period', *other, 'hour').values[periods['assignment'].values]
+    values = np.moveaxis(values, 0, -2).reshape(values.shape[1:-1] + (-1,))
+    time = (periods['day'].values[:, None]
+            + np.arange(24) * np.timedelta64(1, 'h')).ravel()
+    coords = {d: periods[d].values for d in other}
+    coords['time'] = time
+    return xr.DataArray(values, coords=coords, dims=other + ['time'], name=variable)
@@ -0,0 +1,130 @@
+"""
+Paginated time-series figures of (site, time) profiles.
+
+Series are downsampled with Largest-Triangle-Three-Buckets (LTTB), which
+keeps peaks and troughs, before anything is drawn. Pages of a fixed number
+of sites are rendered on Agg canvases, without pyplot, in worker processes
+and written to files, so any number of sites can be plotted. matplotlib is
+imported only inside the workers.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def lttb_indices(y, n_out):
+    """
+    Indices of the LTTB downsampling of every row of ``y`` (n, time) to
+    ``n_out`` points, assuming equally spaced time steps. The buckets are
+    walked once for all rows together. Returns an (n, n_out) integer array.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n, ntime = y.shape
+    if n_out >= ntime or n_out < 3:
+        return np.broadcast_to(np.arange(ntime), (n, ntime))
+
+    # Bucket edges for the interior points; first and last are always kept
+    edges = np.linspace(1, ntime - 1, n_out - 1).astype(int)
+    rows = np.arange(n)
+    selected = np.empty((n, n_out), dtype=int)
+    selected[:, 0] = 0
+    selected[:, -1] = ntime - 1
+
+    a = np.zeros(n, dtype=int)
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Average point of the next bucket (the last point for the last bucket)
+        if i + 2 < n_out - 1:
+            nstart, nstop = edges[i + 1], edges[i + 2]
+        else:
+            nstart, nstop = ntime - 1, ntime
+        cx = 0.5 * (nstart + nstop - 1)
+        cy = y[:, nstart:nstop].mean(axis=1)
+
+        bx = np.arange(start, stop)
+        by = y[:, start:stop]
+        ay = y[rows, a]
+        area = np.abs((a[:, None] - cx) * (by - ay[:, None])
+                      - (a[:, None] - bx[None, :]) * (cy - ay)[:, None])
+        a = start + area.argmax(axis=1)
+        selected[:, i + 1] = a
+    return selected
+
+
+def _ylims(profiles, sites):
+    "(0, 1) for per-unit profiles, (0, capacity) per site for MW, else None."
+    if profiles.attrs.get('units') == 'p.u.':
+        return [(0, 1)] * profiles.sizes['site']
+    if sites is not None and 'capacity' in sites:
+        capacity = sites['capacity'].reindex(profiles.indexes['site'])
+        return [(0, c) for c in capacity]
+    return [None] * profiles.sizes['site']
+
+
+def _render_page(filename, names, times, values, ylims, title, ylabel, figsize, dpi):
+    "Draw one page of series and write it to ``filename``."
+    # A bare Figure on an Agg canvas leaves the caller's pyplot backend alone
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(len(names), squeeze=False)[:, 0]
+    for ax, name, t, v, ylim in zip(axes, names, times, values, ylims):
+        ax.plot(t, v, linewidth=0.8)
+        ax.set_title(name)
+        if ylim is not None:
+            ax.set_ylim(ylim)
+        if ax is not axes[-1]:
+            ax.xaxis.set_ticklabels([])
+    axes[len(axes) // 2].yaxis.set_label_text(ylabel or '')
+    axes[-1].xaxis.set_label_text('date')
+    if title:
+        fig.suptitle(title, fontsize=16)
+    fig.subplots_adjust(hspace=0.5)
+    fig.savefig(filename, dpi=dpi)
+    return filename
+
+
+def plot_profiles(profiles, directory, sites=None, per_page=5, max_points=2000,
+                  title=None, ylabel=None, figsize=(15, 10), dpi=100,
+                  name_format='page_{:03d}.png', processes=None):
+    """
+    Plot every site of the (site, time) ``profiles`` to paginated figures.
+
+    Each page holds ``per_page`` sites and is written to ``directory`` as
+    ``name_format.format(page)``. Series longer than ``max_points`` are
+    downsampled with LTTB. The y-axis runs from 0 to 1 for per-unit
+    profiles and from 0 to the ``capacity`` of the site table ``sites``
+    otherwise. Pages are rendered by ``processes`` workers (all cores by
+    default). Returns the list of files written.
+    """
+    profiles = profiles.transpose('site', 'time')
+    os.makedirs(directory, exist_ok=True)
+
+    values = profiles.values
+    idx = lttb_indices(values, max_points)
+    time = profiles['time'].values[idx]
+    values = np.take_along_axis(values, idx, axis=1)
+    names = [str(s) for s in profiles.indexes['site']]
+    ylims = _ylims(profiles, sites)
+
+    pages = []
+    for i, start in enumerate(range(0, len(names), per_page)):
+        page = slice(start, start + per_page)
+        pages.append((os.path.join(directory, name_format.format(i)),
+                      names[page], time[page], values[page], ylims[page],
+                      title, ylabel, figsize, dpi))
+    logger.info("Rendering %d sites on %d pages to %s", len(names), len(pages), directory)
+
+    if processes is None:
+        processes = min(len(pages), os.cpu_count() or 1)
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            return list(executor.map(_render_page, *zip(*pages)))
+    return [_render_page(*page) for page in pages]
@@ -0,0 +1,194 @@
+"""
+Solar PV conversion on (time, cell) arrays.
+
+The models follow the ones used by ``cutout.pv`` in atlite: a low-precision
+solar position algorithm, a tilted-plane irradiation with isotropic diffuse
+sky and the Huld or Bofinger panel models. They work on plain NumPy arrays so they can be
+evaluated on the handful of cells that actually hold sites instead of the
+whole cutout grid.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .resources import get_panel_config
+
+
+SOLAR_CONSTANT = 1361.  # W/m2
+
+
+def solar_position(time, lon, lat):
+    """
+    Solar altitude and azimuth (radians, azimuth clockwise from north).
+
+    ``time`` is a DatetimeIndex in UTC, ``lon`` and ``lat`` are arrays of
+    cell coordinates in degrees. Returns two arrays of shape (time, cell).
+    """
+    time = pd.DatetimeIndex(time)
+    n = ((time - pd.Timestamp('2000-01-01 12:00')) / pd.Timedelta('1D')).values
+    n = n[:, np.newaxis]
+
+    # Ecliptic coordinates
+    L = np.deg2rad(280.460 + 0.9856474 * n)
+    g = np.deg2rad(357.528 + 0.9856003 * n)
+    ec_lon = L + np.deg2rad(1.915) * np.sin(g) + np.deg2rad(0.020) * np.sin(2 * g)
+    obliquity = np.deg2rad(23.439 - 0.0000004 * n)
+
+    # Equatorial coordinates
+    ra = np.arctan2(np.cos(obliquity) * np.sin(ec_lon), np.cos(ec_lon))
+    dec = np.arcsin(np.sin(obliquity) * np.sin(ec_lon))
+
+    # Local hour angle
+    hour = (time.hour + time.minute / 60.).values[:, np.newaxis]
+    gmst = np.mod(6.697375 + 0.0657098242 * n + hour, 24.)
+    lmst = np.deg2rad(gmst * 15.) + np.deg2rad(np.asarray(lon, dtype=float))
+    h = np.mod(lmst - ra + np.pi, 2 * np.pi) - np.pi
+
+    lat = np.deg2rad(np.asarray(lat, dtype=float))
+    altitude = np.arcsin(np.sin(dec) * np.sin(lat) +
+                         np.cos(dec) * np.cos(lat) * np.cos(h))
+    azimuth = np.mod(np.arctan2(-np.sin(h),
+                                np.tan(dec) * np.cos(lat) - np.sin(lat) * np.cos(h)),
+                     2 * np.pi)
+    return altitude, azimuth
+
+
+def cos_incidence(altitude, azimuth, slope, surface_azimuth):
+    """
+    Cosine of the angle between the sun and the panel normal.
+
+    ``slope`` and ``surface_azimuth`` are in degrees (azimuth 0 faces north,
+    180 faces south) and broadcast against the solar angles.
+    """
+    slope = np.deg2rad(slope)
+    surface_azimuth = np.deg2rad(surface_azimuth)
+    cosinc = (np.sin(altitude) * np.cos(slope) +
+              np.cos(altitude) * np.sin(slope) * np.cos(azimuth - surface_azimuth))
+    return np.clip(cosinc, 0., None)
+
+
+def tilted_irradiation(ds, altitude, cosincidence, slope):
+    """
+    Total irradiation on the tilted plane in W/m2.
+
+    ``ds`` provides ``influx_direct``, ``influx_diffuse`` and ``albedo``
+    as (time, cell) arrays.
+    """
+    direct = np.asarray(ds['influx_direct'])
+    diffuse = np.asarray(ds['influx_diffuse'])
+    albedo = np.asarray(ds['albedo'])
+
+    sinalt = np.sin(altitude)
+    cosslope = np.cos(np.deg2rad(slope))
+
+    # Beam normal irradiance, bounded to keep low sun angles finite
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beam = np.where(sinalt > 0., direct / sinalt, 0.)
+    beam = np.clip(beam, 0., SOLAR_CONSTANT)
+
+    total = (beam * cosincidence +
+             diffuse * (1. + cosslope) / 2. +
+             albedo * (direct + diffuse) * (1. - cosslope) / 2.)
+    return np.where(altitude > 0., total, 0.)
+
+
+def huld_power(irradiance, temperature, pc):
+    """Per-unit output of the Huld panel model at ambient ``temperature`` in K."""
+    T_ = pc['c_temp_amb'] * temperature + pc['c_temp_irrad'] * irradiance - pc['r_tmod']
+    G_ = irradiance / pc['r_irradiance']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_G_ = np.where(G_ > 0., np.log(G_), 0.)
+    eff = (1. + pc['k_1'] * log_G_ + pc['k_2'] * log_G_ ** 2 +
+           T_ * (pc['k_3'] + pc['k_4'] * log_G_ + pc['k_5'] * log_G_ ** 2) +
+           pc['k_6'] * T_ ** 2)
+    eff = np.clip(np.nan_to_num(eff), 0., None)
+
+    return G_ * eff * pc.get('inverter_efficiency', 1.)
+
+
+def bofinger_power(irradiance, temperature, pc):
+    """Per-unit output of the Bofinger panel model at ambient ``temperature`` in K."""
+    fraction = (pc['NOCT'] - pc['Tamb']) / pc['Intc']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_G = np.where(irradiance > 0., np.log(irradiance), 0.)
+    eta_ref = pc['A'] + pc['B'] * irradiance + pc['C'] * log_G
+    eta = (eta_ref * (1. + pc['D'] * (fraction * irradiance + (temperature - pc['Tstd']))) /
+           (1. + pc['D'] * fraction / pc['ta'] * eta_ref * irradiance))
+
+    capacity = (pc['A'] + pc['B'] * 1000. + pc['C'] * np.log(1000.)) * 1e3
+    power = irradiance * eta * (pc.get('inverter_efficiency', 1.) / capacity)
+    above = (irradiance >= pc['threshold']) & (irradiance > 0.)
+    return np.where(above, np.nan_to_num(power), 0.)
+
+
+PANEL_MODELS = {'huld': huld_power, 'bofinger': bofinger_power}
+
+
+def group_orientations(cell, slope, azimuth):
+    """
+    Collapse (cell, slope, azimuth) triples into unique groups.
+
+    Returns the unique ``cell``, ``slope`` and ``azimuth`` arrays of the
+    groups and, for every input triple, the index of its group.
+    """
+    cell, slope, azimuth = np.broadcast_arrays(np.asarray(cell),
+                                               np.asarray(slope, dtype=float),
+                                               np.asarray(azimuth, dtype=float))
+    keys = np.stack([cell.astype(float), slope, azimuth], axis=1)
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return (groups[:, 0].astype(int), groups[:, 1], groups[:, 2]), inverse.ravel()
+
+
+def _check_model(pc):
+    "Return the model name of panel config ``pc``, which must be in ``PANEL_MODELS``."
+    model = pc.get('model', 'huld')
+    if model not in PANEL_MODELS:
+        raise ValueError("Unsupported panel model '{}' of panel '{}', expected one of {}"
+                         .format(model, pc.get('name'), ', '.join(sorted(PANEL_MODELS))))
+    return model
+
+
+def project_irradiation(ds, sun, slope, azimuth, cell=None):
+    """
+    Tilted-plane irradiation of many orientations in one batched operation.
+
+    ``sun`` is the (altitude, azimuth) pair from ``solar_position`` for the
+    cells of ``ds``, so solar geometry is computed once and shared by all
+    orientations. ``slope`` and ``azimuth`` are arrays of orientations,
+    each evaluated at the column ``cell`` of ``ds`` (default: one orientation
+    per column). Returns the irradiation in W/m2 and the ambient temperature
+    in K, both of shape (time, orientation).
+    """
+    if cell is None:
+        cell = slice(None)
+    altitude, sun_azimuth = sun[0][:, cell], sun[1][:, cell]
+    columns = {v: ds[v].values[:, cell]
+               for v in ('influx_direct', 'influx_diffuse', 'albedo', 'temperature')}
+
+    cosinc = cos_incidence(altitude, sun_azimuth, slope, azimuth)
+    return tilted_irradiation(columns, altitude, cosinc, slope), columns['temperature']
+
+
+def project_pv(ds, sun, panel, slope, azimuth, cell=None):
+    """
+    Per-unit PV output of many orientations in one batched operation.
+
+    Arguments as for ``project_irradiation``; the panel model must be one of
+    ``PANEL_MODELS``. Returns an array of shape (time, orientation).
+    """
+    pc = get_panel_config(panel)
+    model = _check_model(pc)
+    irradiance, temperature = project_irradiation(ds, sun, slope, azimuth, cell)
+    return PANEL_MODELS[model](irradiance, temperature, pc)
+
+
+def convert_pv(ds, panel, slope, azimuth):
+    """
+    Per-unit PV output on a dataset with dims (time, cell).
+
+    ``slope`` and ``azimuth`` are scalars or one value per cell.
+    """
+    sun = solar_position(ds.indexes['time'], ds['lon'].values, ds['lat'].values)
+    return project_pv(ds, sun, panel, slope, azimuth)
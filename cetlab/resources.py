@@ -0,0 +1,68 @@
+"""
+Panel and turbine configurations used by the conversion functions.
+
+Configurations are plain dicts in the same layout atlite uses, so a dict
+returned by ``atlite.resource`` can be passed in directly. Named
+configurations are looked up in atlite first; the copies below are only
+used when atlite is not importable (e.g. on offline worker machines).
+"""
+
+import numpy as np
+
+
+# Huld (2010) CdTe thin-film and crystalline silicon modules, as shipped with atlite
+PANELS = {
+    'CdTe': dict(name='CdTe', model='huld',
+                 r_tmod=298.15, r_irradiance=1000.,
+                 k_1=-0.103251, k_2=-0.040446, k_3=-0.001667,
+                 k_4=-0.002075, k_5=-0.001445, k_6=-0.000023,
+                 c_temp_amb=1., c_temp_irrad=0.035,
+                 inverter_efficiency=0.9),
+    'CSi': dict(name='CSi', model='huld',
+                r_tmod=298., r_irradiance=1000.,
+                k_1=-0.017162, k_2=-0.040289, k_3=-0.004681,
+                k_4=0.000148, k_5=0.000169, k_6=0.000005,
+                c_temp_amb=1., c_temp_irrad=0.035,
+                inverter_efficiency=0.9),
+}
+
+# Power curves in MW against hub-height wind speed in m/s
+TURBINES = {
+    'Vestas_V112_3MW': dict(
+        name='Vestas_V112_3MW', hub_height=119., P=3.,
+        V=np.array([0., 2.9, 3., 3.5, 4., 4.5, 5., 5.5, 6., 6.5, 7.,
+                    7.5, 8., 8.5, 9., 9.5, 10., 10.5, 11., 11.5, 12.,
+                    12.5, 25., 25.1]),
+        POW=np.array([0., 0., 0.007, 0.053, 0.123, 0.207, 0.309, 0.429,
+                      0.567, 0.726, 0.909, 1.119, 1.356, 1.621, 1.916,
+                      2.221, 2.494, 2.715, 2.857, 2.94, 2.98, 3., 3.,
+                      0.])),
+}
+
+
+def get_panel_config(panel):
+    """Return the configuration dict of a solar panel given by name or dict."""
+    if isinstance(panel, dict):
+        return panel
+    try:
+        from atlite.resource import get_solarpanelconfig
+    except ImportError:
+        if panel not in PANELS:
+            raise KeyError("Unknown panel '{}' and atlite is not available"
+                           .format(panel))
+        return dict(PANELS[panel])
+    return get_solarpanelconfig(panel)
+
+
+def get_turbine_config(turbine):
+    """Return the configuration dict of a wind turbine given by name or dict."""
+    if isinstance(turbine, dict):
+        return turbine
+    try:
+        from atlite.resource import get_windturbineconfig
+    except ImportError:
+        if turbine not in TURBINES:
+            raise KeyError("Unknown turbine '{}' and atlite is not available"
+                           .format(turbine))
+        return dict(TURBINES[turbine])
+    return get_windturbineconfig(turbine)
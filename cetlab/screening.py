@@ -0,0 +1,119 @@
+"""
+Whole-region screening of candidate sites.
+
+Every cell of a region is converted in one vectorized pass per time chunk
+and summarized by its mean capacity factor and, optionally, variability
+metrics. The best cells are returned as a site table that can be fed to
+``pv_generation`` / ``wind_generation`` directly. Working chunk by chunk keeps
+memory at one chunk of the masked cells, so multi-year cutouts of a whole
+country can be screened on a workstation.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .convert import PV_VARIABLES, gather, open_cutout, wind_variables
+from .masks import as_mask
+from .pv import convert_pv
+from .streaming import time_chunks
+from .wind import convert_wind
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def latitude_orientation(lat):
+    "Panels tilted by the latitude and facing the equator."
+    lat = np.asarray(lat, dtype=float)
+    return np.abs(lat), np.where(lat < 0., 0., 180.)
+
+
+def screen_cells(cutout, technology, region=None, freq='M', variability=True,
+                 panel='CdTe', orientation=None, turbine='Vestas_V112_3MW'):
+    """
+    Capacity factor statistics of every cell in ``region``.
+
+    ``region`` is a region name such as 'South Africa' (rasterized once per
+    grid and reused from the ``MaskStore``), a geometry, a (y, x) mask or
+    None for the whole cutout. PV cells use a common ``orientation`` dict
+    or, by default, a latitude tilt facing the equator. With
+    ``variability`` the standard deviation and the mean absolute hourly
+    change of the capacity factor are added. Returns a DataFrame with one
+    row per cell, sorted by descending mean capacity factor.
+    """
+    ds = open_cutout(cutout)
+    iy, ix = np.nonzero(as_mask(ds, region).values)
+    lon, lat = ds['x'].values[ix], ds['y'].values[iy]
+    logger.info("Screening %d cells for %s", len(iy), technology)
+
+    if technology == 'pv':
+        variables = PV_VARIABLES
+        if orientation is None:
+            slope, azimuth = latitude_orientation(lat)
+        else:
+            slope = np.full(len(iy), float(orientation['slope']))
+            azimuth = np.full(len(iy), float(orientation['azimuth']))
+    elif technology == 'wind':
+        variables = wind_variables(ds)
+    else:
+        raise ValueError("Unknown technology '{}'".format(technology))
+
+    n = 0
+    total = np.zeros(len(iy))
+    total_sq = np.zeros(len(iy))
+    ramp = np.zeros(len(iy))
+    last = None
+    for chunk in time_chunks(ds, freq):
+        sub = gather(chunk, iy, ix, variables)
+        if technology == 'pv':
+            cf = convert_pv(sub, panel, slope, azimuth)
+        else:
+            cf = convert_wind(sub, turbine)
+
+        n += len(cf)
+        total += cf.sum(axis=0)
+        if variability:
+            total_sq += (cf ** 2).sum(axis=0)
+            ramp += np.abs(np.diff(cf, axis=0)).sum(axis=0)
+            if last is not None:
+                ramp += np.abs(cf[0] - last)
+            last = cf[-1]
+
+    screening = pd.DataFrame({'x': lon, 'y': lat, 'iy': iy, 'ix': ix,
+                              'mean cf': total / n})
+    if variability:
+        screening['std cf'] = np.sqrt(np.clip(total_sq / n - (total / n) ** 2, 0., None))
+        screening['mean ramp'] = ramp / max(n - 1, 1)
+    if technology == 'pv':
+        screening['optimal slope'] = slope
+        screening['optimal azimuthal'] = azimuth
+
+    return screening.sort_values('mean cf', ascending=False, kind='stable')\
+                    .reset_index(drop=True)
+
+
+def candidate_sites(screening, n=10, capacity=1., by='mean cf'):
+    """
+    Site table of the ``n`` best cells of a screening.
+
+    Cells are ranked by the column ``by`` (largest first) and every site gets
+    the installed ``capacity`` in MW.
+    """
+    top = screening.nlargest(n, by)
+    columns = [c for c in ('x', 'y', 'optimal slope', 'optimal azimuthal')
+               if c in top]
+    sites = top[columns].copy()
+    sites['capacity'] = capacity
+    sites['mean cf'] = top['mean cf']
+    sites.index = pd.Index(['site_{}'.format(i) for i in range(len(sites))],
+                           name='name')
+    return sites
+
+
+def screen_region(cutout, technology, region=None, n=10, capacity=1., **kwds):
+    """
+    The ``n`` cells of ``region`` with the highest mean capacity factor as a
+    site table; see ``screen_cells`` for the keyword arguments.
+    """
+    return candidate_sites(screen_cells(cutout, technology, region, **kwds),
+                           n=n, capacity=capacity)
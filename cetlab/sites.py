@@ -0,0 +1,120 @@
+"""
+Mapping of site coordinates to cutout grid cells.
+
+Sites are snapped to the cell whose center is closest, without building any
+geometry: on regular grids the cell index follows from the coordinates
+arithmetically, on irregular 1-D axes from a binary search and on
+curvilinear grids (2-D ``lon``/``lat`` coordinates) from a KD-tree. The
+integer indices returned are used for direct gathers from the weather data.
+"""
+
+import numpy as np
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _axis_indices(coord, values):
+    """
+    Index of the nearest entry of the 1-D ``coord`` for every value.
+
+    Values more than half a grid spacing outside the axis get -1.
+    """
+    coord = np.asarray(coord, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(coord) == 1:
+        return np.zeros(len(values), dtype=int)
+
+    step = np.diff(coord)
+    if np.allclose(step, step[0]):
+        # Regular axis: index is pure arithmetic
+        idx = np.rint((values - coord[0]) / step[0]).astype(int)
+    else:
+        order = np.argsort(coord)
+        sorted_coord = coord[order]
+        pos = np.clip(np.searchsorted(sorted_coord, values), 1, len(coord) - 1)
+        left = values - sorted_coord[pos - 1] <= sorted_coord[pos] - values
+        idx = order[np.where(left, pos - 1, pos)]
+        # Keep sites off either end of the axis detectable
+        half = np.abs(step[[0, -1]]) / 2.
+        outside = ((values < sorted_coord[0] - half.min()) |
+                   (values > sorted_coord[-1] + half.min()))
+        idx[outside] = -1
+
+    idx[(idx < 0) | (idx >= len(coord))] = -1
+    return idx
+
+
+def _to_xyz(lon, lat):
+    "Unit vectors of points given in degrees."
+    lon, lat = np.deg2rad(lon), np.deg2rad(lat)
+    return np.stack([np.cos(lat) * np.cos(lon),
+                     np.cos(lat) * np.sin(lon),
+                     np.sin(lat)], axis=-1)
+
+
+def _grid_spacing(xyz):
+    "Largest chord to a neighbouring point for every point of a (ny, nx, 3) grid."
+    spacing = np.zeros(xyz.shape[:2])
+    for axis in (0, 1):
+        if xyz.shape[axis] < 2:
+            continue
+        d = np.linalg.norm(np.diff(xyz, axis=axis), axis=-1)
+        lead = [slice(None)] * 2
+        lead[axis] = slice(None, -1)
+        trail = [slice(None)] * 2
+        trail[axis] = slice(1, None)
+        spacing[tuple(lead)] = np.maximum(spacing[tuple(lead)], d)
+        spacing[tuple(trail)] = np.maximum(spacing[tuple(trail)], d)
+    return spacing
+
+
+def _kdtree_indices(lon, lat, x, y):
+    """
+    Flat index of the nearest point of a curvilinear (y, x) grid for every
+    site, -1 for sites farther than one grid spacing from it.
+    """
+    from scipy.spatial import cKDTree
+
+    grid = _to_xyz(lon, lat)
+    tree = cKDTree(grid.reshape(-1, 3))
+    distance, idx = tree.query(_to_xyz(np.asarray(x, dtype=float),
+                                       np.asarray(y, dtype=float)))
+    spacing = _grid_spacing(grid).ravel()
+    return np.where(distance > spacing[idx] * (1. + 1e-9), -1, idx)
+
+
+def map_sites(ds, sites):
+    """
+    Grid cells of ``ds`` holding each site of the site table ``sites``.
+
+    Returns a DataFrame indexed like ``sites`` with the integer cell indices
+    ``iy``, ``ix`` and ``cell`` (flat index into a (y, x) grid) and the
+    coordinates ``x``, ``y`` of the cell centers. Raises a ValueError if any
+    site lies outside the grid.
+    """
+    x, y = np.asarray(sites['x'], dtype=float), np.asarray(sites['y'], dtype=float)
+    nx, ny = ds.sizes['x'], ds.sizes['y']
+
+    if 'lon' in ds.coords and ds['lon'].ndim == 2:
+        lon, lat = ds['lon'].transpose('y', 'x'), ds['lat'].transpose('y', 'x')
+        cell = _kdtree_indices(lon.values, lat.values, x, y)
+        outside = cell < 0
+        if outside.any():
+            raise ValueError("Sites outside of the cutout grid: {}"
+                             .format(', '.join(map(str, sites.index[outside]))))
+        iy, ix = np.unravel_index(cell, (ny, nx))
+        cell_x, cell_y = lon.values.ravel()[cell], lat.values.ravel()[cell]
+    else:
+        ix = _axis_indices(ds['x'].values, x)
+        iy = _axis_indices(ds['y'].values, y)
+        outside = (ix < 0) | (iy < 0)
+        if outside.any():
+            raise ValueError("Sites outside of the cutout grid: {}"
+                             .format(', '.join(map(str, sites.index[outside]))))
+        cell = iy * nx + ix
+        cell_x, cell_y = ds['x'].values[ix], ds['y'].values[iy]
+
+    return pd.DataFrame({'iy': iy, 'ix': ix, 'cell': cell,
+                         'x': cell_x, 'y': cell_y}, index=sites.index)
@@ -0,0 +1,132 @@
+"""
+Single-pass statistics of site profiles.
+
+``ProfileStatistics`` is updated with one (site, time) chunk at a time, e.g.
+straight from ``stream_generation``, and keeps only running sums per site:
+mean capacity factor and energy, a fixed-bin histogram of the capacity
+factor from which percentiles are read, monthly means and the mean 24-hour
+diurnal profile. Summaries for thousands of sites over many years never
+need the full time series in memory.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def capacity_factor(profiles, sites):
+    """
+    Per-unit (site, time) profiles, dividing generation in MW by the
+    ``capacity`` column of the site table. Per-unit input is returned as is.
+    """
+    if profiles.attrs.get('units') == 'p.u.':
+        return profiles
+    capacity = xr.DataArray(np.asarray(sites['capacity'].reindex(profiles.indexes['site']),
+                                       dtype=float), dims='site')
+    cf = profiles / capacity
+    return cf.rename('capacity factor').assign_attrs(units='p.u.')
+
+
+class ProfileStatistics(object):
+    """
+    Running statistics of the profiles of the sites in the site table ``sites``.
+
+    The capacity factor histogram has ``bins`` equal bins on [0, 1], which
+    bounds the error of the reported ``quantiles`` by 1 / ``bins``.
+    """
+
+    def __init__(self, sites, quantiles=(0.05, 0.5, 0.95), bins=1000):
+        self.sites = sites
+        self.quantiles = quantiles
+        self.bins = bins
+
+        n = len(sites)
+        self.count = 0
+        self.hours = 0.
+        self.total = np.zeros(n)
+        self.histogram = np.zeros((n, bins), dtype=np.int64)
+        self.diurnal_total = np.zeros((n, 24))
+        self.diurnal_count = np.zeros(24, dtype=np.int64)
+        self.monthly_total = {}
+        self.monthly_count = {}
+
+    def update(self, profiles):
+        "Add a (site, time) chunk of generation in MW or per-unit profiles."
+        cf = capacity_factor(profiles, self.sites).reindex(site=self.sites.index)
+        values = cf.transpose('site', 'time').values
+        time = cf.indexes['time']
+        nsite, ntime = values.shape
+        if ntime == 0:
+            return
+
+        step = (time[1] - time[0]) / pd.Timedelta('1h') if ntime > 1 else 1.
+        self.count += ntime
+        self.hours += ntime * step
+        self.total += values.sum(axis=1)
+
+        # Histogram sketch, one bincount over the flattened (site, bin) index
+        idx = np.clip((values * self.bins).astype(int), 0, self.bins - 1)
+        flat = (np.arange(nsite)[:, np.newaxis] * self.bins + idx).ravel()
+        self.histogram += np.bincount(flat, minlength=nsite * self.bins)\
+                            .reshape(nsite, self.bins)
+
+        # Diurnal and monthly sums as products with one-hot time indicators
+        hour = np.asarray(time.hour)
+        onehot = hour[:, np.newaxis] == np.arange(24)
+        self.diurnal_total += values @ onehot
+        self.diurnal_count += onehot.sum(axis=0)
+
+        periods = time.to_period('M')
+        for period in periods.unique():
+            mask = np.asarray(periods == period)
+            self.monthly_total[period] = self.monthly_total.get(period, 0.) + \
+                values[:, mask].sum(axis=1)
+            self.monthly_count[period] = self.monthly_count.get(period, 0) + mask.sum()
+
+    def observe(self, chunks):
+        """
+        Update with every chunk of ``chunks`` while passing the chunks on,
+        so statistics are collected alongside writing a store.
+        """
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def quantile(self, q):
+        "Capacity factor quantile ``q`` of every site, read off the histogram."
+        cumulative = np.cumsum(self.histogram, axis=1)
+        target = q * cumulative[:, -1]
+        upper = np.argmax(cumulative >= target[:, np.newaxis], axis=1)
+        rows = np.arange(len(upper))
+        below = np.where(upper > 0, cumulative[rows, upper - 1], 0)
+        inside = self.histogram[rows, upper]
+        frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.)
+        return (upper + np.clip(frac, 0., 1.)) / self.bins
+
+    def summary(self):
+        "DataFrame of per-site statistics."
+        capacity = np.asarray(self.sites['capacity'], dtype=float)
+        mean_cf = self.total / max(self.count, 1)
+        summary = pd.DataFrame({'capacity': capacity,
+                                'mean cf': mean_cf,
+                                'mean generation': mean_cf * capacity,
+                                'energy [MWh]': mean_cf * capacity * self.hours,
+                                'hours': self.hours},
+                               index=self.sites.index)
+        for q in self.quantiles:
+            summary['cf p{:g}'.format(100 * q)] = self.quantile(q)
+        return summary
+
+    def monthly(self):
+        "Mean capacity factor per site (rows) and month (columns)."
+        periods = sorted(self.monthly_total)
+        return pd.DataFrame(np.stack([self.monthly_total[p] / self.monthly_count[p]
+                                      for p in periods], axis=1),
+                            index=self.sites.index, columns=pd.PeriodIndex(periods))
+
+    def diurnal(self):
+        "Mean capacity factor per site (rows) and hour of the day (columns)."
+        with np.errstate(invalid='ignore'):
+            return pd.DataFrame(self.diurnal_total / self.diurnal_count,
+                                index=self.sites.index,
+                                columns=pd.Index(np.arange(24), name='hour'))
@@ -0,0 +1,162 @@
+"""
+Chunked, compressed on-disk store for (site, time) profiles.
+
+Profiles are written to a Zarr store, chunked along site and time and
+compressed, with the columns of the site table attached as coordinates
+along ``site``. Opening a store only reads its metadata; slicing a subset of
+sites or a date range reads just the chunks that hold them, so downstream
+input builders can pull one site-year out of a multi-decade store without
+loading the rest. Several stores can share one Zarr hierarchy as groups,
+e.g. one group per batch job.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _require_zarr():
+    try:
+        import zarr  # noqa: F401
+    except ImportError:
+        raise ImportError("Writing and reading profile stores needs the 'zarr' package")
+
+
+class ProfileStore(object):
+    """
+    Profiles of many sites in the Zarr store at ``path`` (optionally in ``group``).
+
+    ``site_chunk`` and ``time_chunk`` set the chunk shape when the store is
+    created; the default of 8760 hours keeps one site-year within one or two
+    chunks. Values are stored as ``dtype``.
+    """
+
+    def __init__(self, path, group=None, site_chunk=16, time_chunk=8760,
+                 dtype='float32'):
+        _require_zarr()
+        self.path = path
+        self.group = group
+        self.site_chunk = site_chunk
+        self.time_chunk = time_chunk
+        self.dtype = dtype
+
+    def _to_dataset(self, profiles, sites):
+        name = profiles.name or 'profile'
+        ds = profiles.to_dataset(name=name)
+        ds.attrs['profiles'] = name
+        if sites is not None:
+            # Zarr coordinate names cannot hold spaces, so site columns are
+            # stored under sanitized names and mapped back when opened
+            sites = sites.reindex(profiles.indexes['site'])
+            columns = {}
+            for c in sites.columns:
+                key = re.sub(r'\W', '_', str(c))
+                while key in columns or key in ds.variables:
+                    key += '_'
+                columns[key] = str(c)
+            ds = ds.assign_coords({k: ('site', sites[c].values) for k, c in columns.items()})
+            ds.attrs['site_columns'] = columns
+        return ds
+
+    def write(self, profiles, sites=None):
+        """
+        Create the store from a (site, time) DataArray, replacing any old one.
+
+        The columns of the site table ``sites`` (indexed by site name) are
+        stored alongside as site metadata.
+        """
+        ds = self._to_dataset(profiles.transpose('site', 'time'), sites)
+        name = ds.attrs['profiles']
+        encoding = {name: {'chunks': (min(self.site_chunk, ds.sizes['site']),
+                                      self.time_chunk),
+                           'dtype': self.dtype},
+                    'time': {'units': 'hours since 1970-01-01', 'dtype': 'int64'}}
+        ds.to_zarr(self.path, group=self.group, mode='w', encoding=encoding)
+
+    def append(self, profiles):
+        "Append a (site, time) DataArray with the same sites along time."
+        ds = profiles.transpose('site', 'time').to_dataset(name=profiles.name or 'profile')
+        # Appending replaces the store attributes, keep the ones of write()
+        ds.attrs = xr.open_dataset(self.path, group=self.group, engine='zarr',
+                                   chunks=None).attrs
+        ds.to_zarr(self.path, group=self.group, append_dim='time')
+
+    def write_chunks(self, chunks, sites=None):
+        """
+        Write a stream of (site, time) chunks, e.g. from ``stream_generation``.
+
+        The first chunk creates the store, later ones are appended. Returns
+        the number of chunks written.
+        """
+        n = 0
+        for chunk in chunks:
+            if n == 0:
+                self.write(chunk, sites)
+            else:
+                self.append(chunk)
+            n += 1
+        return n
+
+    def exists(self):
+        "Whether the store (group) has been written."
+        try:
+            self.open()
+        except (FileNotFoundError, KeyError):
+            return False
+        return True
+
+    def truncate(self, ntime):
+        """
+        Cut the store back to its first ``ntime`` time steps.
+
+        Used to discard a partially written append after an interrupted run.
+        """
+        import zarr
+        group = zarr.open_group(self.path, path=self.group or '', mode='r+')
+        for _, array in group.arrays():
+            dims = getattr(array.metadata, 'dimension_names', None) or \
+                array.attrs.get('_ARRAY_DIMENSIONS', ())
+            if 'time' in dims:
+                shape = list(array.shape)
+                shape[list(dims).index('time')] = ntime
+                array.resize(tuple(shape))
+        zarr.consolidate_metadata(self.path)
+
+    def open(self):
+        """
+        Lazy (site, time) DataArray of the stored profiles.
+
+        Nothing but metadata is read until the array is sliced or loaded; site
+        metadata is available as coordinates along ``site``.
+        """
+        ds = xr.open_dataset(self.path, group=self.group, engine='zarr',
+                             chunks=None)
+        columns = ds.attrs.get('site_columns', {})
+        da = ds[ds.attrs.get('profiles', list(ds.data_vars)[0])]
+        return da.rename({k: c for k, c in columns.items() if k in da.coords})
+
+    def read(self, sites=None, start=None, end=None):
+        """
+        Load the profiles of ``sites`` (default: all) between ``start`` and
+        ``end`` (inclusive date strings or timestamps), reading only the
+        chunks that hold them.
+        """
+        da = self.open()
+        if sites is not None:
+            da = da.sel(site=np.atleast_1d(sites))
+        if start is not None or end is not None:
+            da = da.sel(time=slice(start, end))
+        return da.load()
+
+    @property
+    def sites(self):
+        "Site metadata as a DataFrame indexed by site name."
+        da = self.open()
+        columns = [c for c in da.coords if da[c].dims == ('site',) and c != 'site']
+        return pd.DataFrame({c: da[c].values for c in columns},
+                            index=pd.Index(da.indexes['site'], name='name'))
@@ -0,0 +1,64 @@
+"""
+Chunked profile generation with bounded memory.
+
+Weather data is opened lazily and converted one time chunk (by default one
+month) at a time. Each chunk of site profiles is handed to the caller or
+written to disk before the next one is read, so peak memory stays at about
+one chunk however many years are requested.
+"""
+
+import os
+
+import numpy as np
+
+from .convert import open_cutout, pv_generation, wind_generation
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+CONVERTERS = {'pv': pv_generation, 'wind': wind_generation}
+
+
+def time_chunks(ds, freq='M'):
+    """
+    Split ``ds`` along time into consecutive chunks of one pandas period.
+
+    ``freq`` is a period alias such as 'M' (months), 'D' or 'Y'.
+    """
+    periods = ds.indexes['time'].to_period(freq)
+    bounds = np.flatnonzero(periods[1:] != periods[:-1]) + 1
+    for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(periods)]):
+        yield ds.isel(time=slice(start, stop))
+
+
+def stream_generation(cutout, sites, technology, freq='M', **kwds):
+    """
+    Generate the (site, time) profiles of ``sites`` one time chunk at a time.
+
+    ``technology`` is 'pv' or 'wind'; remaining keyword arguments are passed
+    on to ``pv_generation`` or ``wind_generation``. Yields one DataArray per
+    chunk.
+    """
+    convert = CONVERTERS[technology]
+    ds = open_cutout(cutout)
+    for chunk in time_chunks(ds, freq):
+        logger.debug("Converting %s from %s to %s", technology,
+                     chunk.indexes['time'][0], chunk.indexes['time'][-1])
+        yield convert(chunk, sites, **kwds)
+
+
+def write_chunks(chunks, directory, name_format='{:%Y%m}.nc'):
+    """
+    Write every chunk of ``chunks`` to its own NetCDF file in ``directory``.
+
+    Files are named after the first timestamp of each chunk, by default one
+    ``YYYYMM.nc`` per month like a prepared cutout. Returns the file names.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for chunk in chunks:
+        fn = os.path.join(directory, name_format.format(chunk.indexes['time'][0]))
+        chunk.to_netcdf(fn)
+        files.append(fn)
+    return files
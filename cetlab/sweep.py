@@ -0,0 +1,150 @@
+"""
+Technology sweeps over many panels or turbines.
+
+The weather-derived intermediates (tilted irradiation for PV, hub-height wind
+speeds for wind) are computed once per cutout and site set; every panel
+model or power curve is then applied to them in one batched operation. The
+result is a (technology, site, time) array, so comparing technologies costs
+one weather pass plus cheap curve evaluations.
+"""
+
+import numpy as np
+import xarray as xr
+
+from .convert import PV_VARIABLES, gather_cells, open_cutout, wind_variables
+from .pv import (PANEL_MODELS, _check_model, group_orientations,
+                 project_irradiation, solar_position)
+from .resources import get_panel_config, get_turbine_config
+from .wind import extrapolate_wind_speed
+
+
+MODEL_PARAMETERS = {
+    'huld': ['r_tmod', 'r_irradiance', 'k_1', 'k_2', 'k_3', 'k_4',
+             'k_5', 'k_6', 'c_temp_amb', 'c_temp_irrad'],
+    'bofinger': ['A', 'B', 'C', 'D', 'NOCT', 'Tamb', 'Tstd', 'Intc', 'ta',
+                 'threshold'],
+}
+
+
+def _name(technology, config):
+    return technology if isinstance(technology, str) else config.get('name', str(technology))
+
+
+def stack_panels(panels):
+    """
+    Parameters of several panels sharing one model as arrays of shape
+    (panel, 1, 1), which broadcast against (time, site) irradiation in the
+    model function of ``PANEL_MODELS``.
+
+    Returns the model name, the stacked parameters and the panel names.
+    Raises ValueError for unsupported or mixed panel models.
+    """
+    pcs = [get_panel_config(p) for p in panels]
+    models = set(_check_model(pc) for pc in pcs)
+    if len(models) != 1:
+        raise ValueError("Panels of one stack must share a model, got {}"
+                         .format(', '.join(sorted(models))))
+    model = models.pop()
+    stacked = {k: np.array([pc[k] for pc in pcs], dtype=float)[:, np.newaxis, np.newaxis]
+               for k in MODEL_PARAMETERS[model]}
+    stacked['inverter_efficiency'] = np.array(
+        [pc.get('inverter_efficiency', 1.) for pc in pcs])[:, np.newaxis, np.newaxis]
+    return model, stacked, [_name(p, pc) for p, pc in zip(panels, pcs)]
+
+
+def power_curve_table(turbines):
+    """
+    Per-unit power curves of several turbines sampled on the union of their
+    wind speed breakpoints.
+
+    Every curve is linear between consecutive breakpoints, so interpolating
+    the table at a shared position reproduces each curve exactly. Returns
+    the speed grid and a (turbine, speed) array.
+    """
+    tcs = [get_turbine_config(t) for t in turbines]
+    grid = np.unique(np.concatenate([np.asarray(tc['V'], dtype=float) for tc in tcs]))
+    table = np.stack([np.interp(grid, tc['V'], np.asarray(tc['POW']) / tc['P'])
+                      for tc in tcs])
+    return grid, table
+
+
+def _to_sweep_array(values, names, time, sites, capacity_factor):
+    "Wrap (technology, time, site) per-unit output into a DataArray."
+    if capacity_factor:
+        name, units = 'capacity factor', 'p.u.'
+    else:
+        values = values * np.asarray(sites['capacity'], dtype=float)
+        name, units = 'generation', 'MW'
+    return xr.DataArray(values.transpose(0, 2, 1), dims=('technology', 'site', 'time'),
+                        coords={'technology': names, 'site': np.asarray(sites.index),
+                                'time': time},
+                        name=name, attrs={'units': units})
+
+
+def pv_sweep(cutout, sites, panels, orientation=None, capacity_factor=True,
+             slope='optimal slope', azimuth='optimal azimuthal'):
+    """
+    Output of every site for each panel in ``panels``.
+
+    Irradiation is projected once for the site orientations (see
+    ``pv_generation``) and the panels of each model (one of
+    ``PANEL_MODELS``) are evaluated on it together. Returns a (technology, site, time) DataArray, per-unit unless
+    ``capacity_factor`` is False.
+    """
+    pcs = [get_panel_config(p) for p in panels]
+    models = [_check_model(pc) for pc in pcs]
+
+    ds = open_cutout(cutout)
+    sub, site_cell = gather_cells(ds, sites, PV_VARIABLES)
+
+    if orientation is None:
+        site_slope = np.asarray(sites[slope], dtype=float)
+        site_azimuth = np.asarray(sites[azimuth], dtype=float)
+    else:
+        site_slope, site_azimuth = orientation['slope'], orientation['azimuth']
+
+    sun = solar_position(sub.indexes['time'], sub['lon'].values, sub['lat'].values)
+    (cell, group_slope, group_azimuth), site_group = \
+        group_orientations(site_cell, site_slope, site_azimuth)
+    irradiance, temperature = project_irradiation(sub, sun, group_slope,
+                                                  group_azimuth, cell=cell)
+
+    values = np.empty((len(pcs),) + irradiance.shape)
+    for model in set(models):
+        of_model = [i for i, m in enumerate(models) if m == model]
+        _, stacked, _ = stack_panels([pcs[i] for i in of_model])
+        values[of_model] = PANEL_MODELS[model](irradiance, temperature, stacked)
+
+    names = [_name(p, pc) for p, pc in zip(panels, pcs)]
+    return _to_sweep_array(values[:, :, site_group], names, sub.indexes['time'],
+                           sites, capacity_factor)
+
+
+def wind_sweep(cutout, sites, turbines, capacity_factor=True):
+    """
+    Output of every site for each turbine in ``turbines``.
+
+    Hub-height wind speeds are extrapolated once per distinct hub height and
+    the power curves of all turbines at that height are interpolated with a
+    single shared index lookup. Returns a (technology, site, time)
+    DataArray, per-unit unless ``capacity_factor`` is False.
+    """
+    ds = open_cutout(cutout)
+    sub, site_cell = gather_cells(ds, sites, wind_variables(ds))
+
+    tcs = [get_turbine_config(t) for t in turbines]
+    grid, table = power_curve_table(tcs)
+    heights = np.array([tc['hub_height'] for tc in tcs], dtype=float)
+
+    values = np.empty((len(tcs), sub.sizes['time'], sub.sizes['cell']))
+    for height in np.unique(heights):
+        wnd = extrapolate_wind_speed(sub, to_height=height)
+        idx = np.clip(np.searchsorted(grid, wnd, side='right') - 1, 0, len(grid) - 2)
+        frac = np.clip((wnd - grid[idx]) / (grid[idx + 1] - grid[idx]), 0., 1.)
+        at_height = np.flatnonzero(heights == height)
+        curves = table[at_height]
+        values[at_height] = curves[:, idx] * (1. - frac) + curves[:, idx + 1] * frac
+
+    names = [_name(t, tc) for t, tc in zip(turbines, tcs)]
+    return _to_sweep_array(values[:, :, site_cell], names, sub.indexes['time'],
+                           sites, capacity_factor)
@@ -0,0 +1,95 @@
+"""
+Synthetic ERA5-like weather data and site tables.
+
+The data has the variables, units, coordinates and axis order of a
+prepared atlite ERA5 cutout, with a realistic diurnal and seasonal solar
+cycle, random cloudiness and temporally correlated wind speeds, so the
+whole pipeline can be exercised offline at any grid size, length and
+number of sites (e.g. by ``cetlab.benchmark``).
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .pv import solar_position
+
+
+def _ar1(rng, shape, rho):
+    "Standard normal series along the first axis with lag-1 correlation ``rho``."
+    noise = rng.standard_normal(shape).astype('float32')
+    scale = np.float32(np.sqrt(1. - rho ** 2))
+    for t in range(1, shape[0]):
+        noise[t] = rho * noise[t - 1] + scale * noise[t]
+    return noise
+
+
+def synthetic_cutout(nx=40, ny=40, hours=744, start='2011-01-01', x0=12.25, y0=-21.5,
+                     resolution=0.25, seed=0, dtype='float32'):
+    """
+    Hourly (time, y, x) Dataset of ERA5 cutout variables.
+
+    The grid starts at the cell centre (``x0``, ``y0``) and runs east and
+    south (descending y, as in ERA5) in steps of ``resolution`` degrees.
+    """
+    rng = np.random.default_rng(seed)
+    x = x0 + resolution * np.arange(nx)
+    y = y0 - resolution * np.arange(ny)
+    time = pd.date_range(start, periods=hours, freq='h')
+    shape = (hours, ny, nx)
+
+    lon, lat = np.meshgrid(x, y)
+    altitude, _ = solar_position(time, lon.ravel(), lat.ravel())
+    sin_alt = np.clip(np.sin(altitude), 0., None).reshape(shape).astype(dtype)
+    toa = 1361. * sin_alt
+
+    # Cloudiness varies smoothly in time; clear sky passes ~75% of TOA
+    clearness = 0.75 / (1. + np.exp(-(1. + _ar1(rng, shape, 0.95))))
+    direct = toa * clearness * (0.3 + 0.7 * clearness / 0.75)
+    diffuse = toa * clearness - direct + 0.1 * toa * (1. - clearness)
+
+    wind = 7.5 * np.exp(0.45 * _ar1(rng, shape, 0.97))
+    roughness = np.broadcast_to(rng.uniform(0.0002, 0.3, (1, ny, nx)), shape)
+    temperature = 288. + 12. * sin_alt + 2. * rng.standard_normal(shape)
+
+    variables = {'influx_toa': toa, 'influx_direct': direct, 'influx_diffuse': diffuse,
+                 'albedo': np.full(shape, 0.2), 'temperature': temperature,
+                 'wnd100m': wind, 'roughness': roughness}
+    units = {'influx_toa': 'W m**-2', 'influx_direct': 'W m**-2',
+             'influx_diffuse': 'W m**-2', 'albedo': '(0 - 1)', 'temperature': 'K',
+             'wnd100m': 'm s**-1', 'roughness': 'm'}
+    return xr.Dataset({k: (('time', 'y', 'x'), np.asarray(v, dtype=dtype), {'units': units[k]})
+                       for k, v in variables.items()},
+                      coords={'x': x, 'y': y, 'time': time},
+                      attrs={'module': 'era5', 'synthetic': 1})
+
+
+def synthetic_sites(ds, n, capacity=5., seed=0):
+    """
+    Site table of ``n`` sites at random positions within the grid of ``ds``,
+    with ``capacity`` MW each and an equator-facing latitude tilt.
+    """
+    rng = np.random.default_rng(seed)
+    x, y = ds['x'].values, ds['y'].values
+    sites = pd.DataFrame({'x': rng.uniform(x.min(), x.max(), n),
+                          'y': rng.uniform(y.min(), y.max(), n),
+                          'capacity': float(capacity)},
+                         index=pd.Index(['site_{}'.format(i) for i in range(n)], name='name'))
+    sites['optimal slope'] = np.abs(sites['y']).round()
+    sites['optimal azimuthal'] = np.where(sites['y'] < 0., 0., 180.)
+    return sites
+
+
+def synthetic_fetch(ds):
+    """
+    ``CutoutCache`` fetch function serving months of ``ds`` instead of
+    downloading them, to exercise the cache offline.
+    """
+    from .cache import select_bbox
+
+    def fetch(module, bbox, year, month, variables, path):
+        month_ds = select_bbox(ds, bbox).sel(time='{:04d}-{:02d}'.format(year, month))
+        if variables is not None:
+            month_ds = month_ds[list(variables)]
+        month_ds.to_netcdf(path)
+    return fetch
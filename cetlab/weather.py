@@ -0,0 +1,121 @@
+"""
+Offline weather source on a local archive of ERA5-format variables.
+
+The archive is a Zarr store or a directory tree of NetCDF tiles, split by
+month, area and/or variable, holding the variables of prepared atlite
+cutouts on one grid. It is opened lazily once; a cutout is a view of the
+archive restricted to a bounding box and months, so nothing is downloaded,
+prepared or copied, and any number of overlapping cutouts share the same
+files. Only the chunks that a conversion touches are read.
+
+``WeatherArchive.get`` takes the same arguments as ``CutoutCache.get``, so
+the archive can stand in for the cache in scripts and batch specs
+(``"archive": "<path>"``).
+"""
+
+import os
+from glob import glob
+
+import numpy as np
+import xarray as xr
+
+from .cache import _bbox, _months
+from .convert import open_months
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _as_indexer(mask):
+    "Slice for a contiguous boolean mask (a view), integer indices otherwise."
+    idx = np.flatnonzero(mask)
+    if len(idx) and idx[-1] - idx[0] + 1 == len(idx):
+        return slice(idx[0], idx[-1] + 1)
+    return idx
+
+
+class WeatherArchive(object):
+    """
+    Local archive of weather data at ``path``.
+
+    ``path`` is a Zarr store (``*.zarr``) or a directory that is searched
+    for NetCDF files matching ``pattern``; the files are combined by their
+    coordinates, so they may be tiles in time, space or variables.
+    """
+
+    def __init__(self, path, pattern=os.path.join('**', '*.nc')):
+        self.path = path
+        self.pattern = pattern
+        self._data = None
+
+    def __getstate__(self):
+        # Workers reopen the archive instead of receiving the open Dataset
+        return dict(self.__dict__, _data=None)
+
+    @property
+    def is_zarr(self):
+        return self.path.rstrip('/').endswith('.zarr')
+
+    @property
+    def data(self):
+        "The whole archive as a lazily loaded Dataset."
+        if self._data is None:
+            if self.is_zarr:
+                self._data = xr.open_zarr(self.path)
+            else:
+                files = sorted(glob(os.path.join(self.path, self.pattern), recursive=True))
+                if not files:
+                    raise FileNotFoundError("No NetCDF files matching '{}' in '{}'"
+                                            .format(self.pattern, self.path))
+                self._data = open_months(files)
+            logger.info("Opened weather archive %s with %d time steps on a %dx%d grid",
+                        self.path, self._data.sizes['time'],
+                        self._data.sizes['y'], self._data.sizes['x'])
+        return self._data
+
+    def get(self, module, xs, ys, years, months, variables=None):
+        """
+        Lazy view of the archive for a cutout specification.
+
+        Arguments follow ``atlite.Cutout``; ``module`` is accepted for
+        compatibility with ``CutoutCache.get`` and ignored.
+        """
+        return self.select(xs, ys, _months(years, months), variables)
+
+    def select(self, xs, ys, months, variables=None):
+        """
+        Lazy view of the archive for a bounding box and a list of (year,
+        month) pairs; months missing from the archive are left out.
+        """
+        ds = self.data
+        bbox = _bbox(xs, ys)
+        x, y = ds.indexes['x'], ds.indexes['y']
+        time = ds.indexes['time']
+        wanted = np.isin(time.year * 100 + time.month,
+                         [year * 100 + month for year, month in months])
+        if not wanted.any():
+            raise KeyError("Archive {} holds none of the months {:04d}-{:02d} to {:04d}-{:02d}"
+                           .format(self.path, *(tuple(months[0]) + tuple(months[-1]))))
+        if variables is not None:
+            ds = ds[list(variables)]
+        return ds.isel(x=_as_indexer((x >= bbox[0]) & (x <= bbox[2])),
+                       y=_as_indexer((y >= bbox[1]) & (y <= bbox[3])),
+                       time=_as_indexer(wanted))
+
+    def add(self, ds, time_chunk=24 * 31, space_chunk=32):
+        """
+        Append the months of ``ds`` (e.g. a prepared cutout) to a Zarr
+        archive, chunked by ``time_chunk`` hours and ``space_chunk`` cells.
+        Data must cover the archive's grid and follow its last time step.
+        """
+        if not self.is_zarr:
+            raise ValueError("Only Zarr archives can be extended, not '{}'".format(self.path))
+        ds = ds.chunk({'time': time_chunk, 'y': space_chunk, 'x': space_chunk})
+        for v in ds.variables.values():
+            v.encoding.pop('chunks', None)
+            v.encoding.pop('preferred_chunks', None)
+        if os.path.exists(self.path):
+            ds.to_zarr(self.path, mode='a', append_dim='time')
+        else:
+            ds.to_zarr(self.path, mode='w')
+        self._data = None
@@ -0,0 +1,33 @@
+"""
+Wind conversion on (time, cell) arrays, following ``cutout.wind`` in atlite.
+"""
+
+import numpy as np
+
+from .resources import get_turbine_config
+
+
+def extrapolate_wind_speed(ds, to_height, from_height=None):
+    """
+    Extrapolate wind speeds to ``to_height`` with the logarithmic law.
+
+    The source height defaults to the ``wnd<h>m`` variable closest to the
+    target height.
+    """
+    if from_height is None:
+        heights = np.asarray([int(v[3:-1]) for v in ds.data_vars
+                              if v.startswith('wnd') and v.endswith('m')])
+        if not len(heights):
+            raise KeyError("Dataset has no 'wnd<h>m' wind speed variable")
+        from_height = heights[np.argmin(np.abs(heights - to_height))]
+
+    wnd = np.asarray(ds['wnd{:d}m'.format(int(from_height))])
+    roughness = np.asarray(ds['roughness'])
+    return wnd * (np.log(to_height / roughness) / np.log(from_height / roughness))
+
+
+def convert_wind(ds, turbine):
+    """Per-unit wind output on a dataset with dims (time, cell)."""
+    tc = get_turbine_config(turbine)
+    wnd_hub = extrapolate_wind_speed(ds, to_height=tc['hub_height'])
+    return np.interp(wnd_hub, tc['V'], np.asarray(tc['POW']) / tc['P'])